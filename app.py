@@ -1,28 +1,57 @@
-﻿import math
-import os
-from email.message import EmailMessage
-import smtplib
-
-from flask import Flask, flash, redirect, render_template, request, url_for
+﻿import os
+
+from flask import (
+    Flask,
+    abort,
+    flash,
+    g,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    send_file,
+    session,
+    url_for,
+)
+from markupsafe import Markup
 from werkzeug.utils import secure_filename
 
+import profiling
+import uploads
+import web_cache
+from cache import TTLCache
 from config import Config
 from db import (
+    add_subscription,
+    create_user,
+    default_user_id,
     delete_book,
+    delete_subscription,
     get_book_detail,
     get_books_with_progress,
+    get_cache_version,
+    get_history_summaries,
     get_reading_history,
-    get_settings,
+    get_subscriptions,
+    get_user,
+    get_user_by_email,
+    get_user_settings,
     init_db,
     insert_book,
     insert_progress,
     set_setting,
     set_book_status,
+    set_user_email,
+    set_user_setting,
     mark_book_completed,
     reset_progress,
+    save_book_index,
+    save_book_units,
     update_pages_per_day,
 )
-from text_processing import count_words, extract_text
+from mail_transport import build_message, get_transport
+from page_cache import get_pages
+from text_processing import index_book, probe_pdf, txt_index_words
 from scheduler import process_book
 
 
@@ -31,62 +60,67 @@ def create_app():
     app.config.from_object(Config)
 
     init_db()
+    web_cache.init_app(app)
+    profiling.init_app(app)
+    fragment_cache = TTLCache(ttl=app.config["FRAGMENT_CACHE_SECONDS"])
+
+    def current_user_id():
+        # There are no logins: the session remembers which reader is being
+        # managed, starting with the first one.
+        if "user_id" not in g:
+            user_id = session.get("user_id")
+            if user_id is None or get_user(user_id) is None:
+                user_id = default_user_id()
+                session["user_id"] = user_id
+            g.user_id = user_id
+        return g.user_id
+
+    def owned_book(book_id):
+        return get_book_detail(book_id, current_user_id())
+
+    def require_book(book_id):
+        if not owned_book(book_id):
+            abort(404)
+
+    def render_library(user_id):
+        books = get_books_with_progress(user_id)
+        return Markup(render_template("library.html", books=books))
 
     @app.route("/")
     def index():
-        books = get_books_with_progress()
-        return render_template("index.html", books=books)
-
-    @app.route("/upload")
-    def upload():
-        return render_template("upload.html")
-
-    @app.route("/upload", methods=["POST"])
-    def upload_post():
-        upload_file = request.files.get("book_file")
-        if not upload_file or not upload_file.filename:
-            return render_template("upload.html", message="Please choose a file.")
+        user_id = current_user_id()
+        cache_key = ("library", Config.DATABASE_PATH, user_id, get_cache_version("books"))
+        library_html = fragment_cache.get_or_set(cache_key, lambda: render_library(user_id))
+        return render_template("index.html", library_html=library_html)
 
-        filename = secure_filename(upload_file.filename)
+    def parse_upload_filename(raw_filename):
+        filename = secure_filename(raw_filename or "")
         file_ext = os.path.splitext(filename)[1].lower().lstrip(".")
-        if file_ext not in app.config["ALLOWED_EXTENSIONS"]:
-            return render_template("upload.html", message="Unsupported file type.")
-
-        os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
-        base_name = os.path.splitext(filename)[0]
-        file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        counter = 1
-        while os.path.exists(file_path):
-            file_path = os.path.join(
-                app.config["UPLOAD_FOLDER"],
-                f"{base_name}-{counter}.{file_ext}",
-            )
-            counter += 1
-        file_path = os.path.abspath(file_path)
-        upload_file.save(file_path)
+        if not filename or file_ext not in app.config["ALLOWED_EXTENSIONS"]:
+            return filename, None
+        return filename, file_ext
 
-        try:
-            text = extract_text(file_path, file_ext)
-        except ValueError as exc:
-            return render_template("upload.html", message=str(exc))
+    def register_book(file_path, file_ext, filename, form, indexed=None):
+        if indexed is None:
+            try:
+                indexed = index_book(file_path, file_ext, app.config["WORDS_PER_PAGE"])
+            except ValueError as exc:
+                return None, str(exc)
 
-        total_words = count_words(text)
+        total_words = indexed["total_words"]
         if total_words == 0:
             try:
                 os.remove(file_path)
             except OSError:
                 pass
-            return render_template(
-                "upload.html",
-                message="No readable text found in the file.",
-            )
-        total_pages = max(1, math.ceil(total_words / app.config["WORDS_PER_PAGE"]))
+            return None, "No readable text found in the file."
+        total_pages = indexed["total_pages"]
 
-        title = request.form.get("title") or os.path.splitext(filename)[0]
-        author = request.form.get("author") or None
-        pages_per_day = request.form.get("pages_per_day")
+        title = form.get("title") or os.path.splitext(filename)[0]
+        author = form.get("author") or None
+        pages_per_day = form.get("pages_per_day")
         if not pages_per_day:
-            settings_data = get_settings()
+            settings_data = get_user_settings(current_user_id())
             pages_per_day = settings_data.get(
                 "default_pages_per_day",
                 app.config["DEFAULT_PAGES_PER_DAY"],
@@ -104,24 +138,176 @@ def create_app():
             file_type=file_ext,
             total_words=total_words,
             total_pages=total_pages,
+            memory_estimate=indexed["memory_estimate"],
+            user_id=current_user_id(),
         )
         insert_progress(book_id, pages_per_day)
+        save_book_index(book_id, indexed["index"])
+        if indexed["units"]:
+            save_book_units(book_id, indexed["units"])
+        return {
+            "book_id": book_id,
+            "title": title,
+            "author": author or "Unknown",
+            "total_words": total_words,
+            "total_pages": total_pages,
+        }, None
+
+    @app.route("/upload")
+    def upload():
+        return render_template("upload.html")
 
+    @app.route("/upload", methods=["POST"])
+    def upload_post():
+        upload_file = request.files.get("book_file")
+        if not upload_file or not upload_file.filename:
+            return render_template("upload.html", message="Please choose a file.")
+
+        filename, file_ext = parse_upload_filename(upload_file.filename)
+        if not file_ext:
+            return render_template("upload.html", message="Unsupported file type.")
+
+        file_path = uploads.unique_upload_path(filename, file_ext)
+        upload_file.save(file_path)
+
+        details, error = register_book(file_path, file_ext, filename, request.form)
+        if error:
+            return render_template("upload.html", message=error)
         return render_template(
             "upload.html",
             message="Upload complete.",
-            details={
-                "title": title,
-                "author": author or "Unknown",
-                "total_words": total_words,
-                "total_pages": total_pages,
-            },
+            details=details,
         )
 
+    def upload_status(state):
+        return {
+            "upload_id": state["upload_id"],
+            "received": state["received"],
+            "total_size": state["total_size"],
+            "words": txt_index_words(state["txt_index"]) if "txt_index" in state else None,
+            "chunk_size": app.config["UPLOAD_CHUNK_SIZE"],
+        }
+
+    @app.route("/upload/chunked", methods=["POST"])
+    def upload_chunked_start():
+        data = request.get_json(silent=True) or request.form
+        filename, file_ext = parse_upload_filename(data.get("filename"))
+        if not file_ext:
+            return jsonify(error="Unsupported file type."), 400
+        try:
+            total_size = int(data.get("size", 0))
+            state = uploads.start_upload(
+                filename,
+                file_ext,
+                total_size,
+                metadata={
+                    key: str(data.get(key) or "")
+                    for key in ("title", "author", "pages_per_day")
+                },
+            )
+        except (TypeError, ValueError) as exc:
+            return jsonify(error=str(exc)), 400
+        return jsonify(upload_status(state)), 201
+
+    @app.route("/upload/chunked/<upload_id>", methods=["GET"])
+    def upload_chunked_status(upload_id):
+        state = uploads.load_upload(upload_id)
+        if not state:
+            return jsonify(error="Unknown upload."), 404
+        return jsonify(upload_status(state))
+
+    @app.route("/upload/chunked/<upload_id>", methods=["PUT"])
+    def upload_chunked_append(upload_id):
+        state = uploads.load_upload(upload_id)
+        if not state:
+            return jsonify(error="Unknown upload."), 404
+        try:
+            offset = int(request.headers.get("Upload-Offset", ""))
+        except ValueError:
+            return jsonify(error="Missing Upload-Offset header."), 400
+        if offset != state["received"]:
+            return jsonify(error="Offset mismatch.", **upload_status(state)), 409
+        try:
+            uploads.append_chunk(state, offset, request.stream)
+        except ValueError as exc:
+            uploads.discard_upload(upload_id)
+            return jsonify(error=str(exc)), 400
+        return jsonify(upload_status(state))
+
+    @app.route("/upload/chunked/<upload_id>/preview", methods=["GET"])
+    def upload_chunked_preview(upload_id):
+        state = uploads.load_upload(upload_id)
+        if not state:
+            return jsonify(error="Unknown upload."), 404
+        if state["received"] < state["total_size"]:
+            return jsonify(error="Upload is not complete.", **upload_status(state)), 409
+
+        words_per_page = app.config["WORDS_PER_PAGE"]
+        if state["file_type"] == "pdf":
+            try:
+                estimate = probe_pdf(uploads.data_path(upload_id), words_per_page)
+            except ValueError as exc:
+                uploads.discard_upload(upload_id)
+                return jsonify(error=str(exc)), 422
+        elif "txt_index" in state:
+            # The whole file has already been paginated on arrival.
+            words = txt_index_words(state["txt_index"])
+            estimate = {
+                "estimated_words": words,
+                "estimated_pages": max(1, -(-words // words_per_page)),
+            }
+        else:
+            estimate = {}
+        return jsonify(**upload_status(state), **estimate)
+
+    @app.route("/upload/chunked/<upload_id>/complete", methods=["POST"])
+    def upload_chunked_complete(upload_id):
+        state = uploads.load_upload(upload_id)
+        if not state:
+            return jsonify(error="Unknown upload."), 404
+        data = request.get_json(silent=True) or request.form
+        file_path = uploads.unique_upload_path(state["filename"], state["file_type"])
+        try:
+            digest = uploads.finish_upload(state, file_path, data.get("sha256"))
+        except ValueError as exc:
+            return jsonify(error=str(exc), **upload_status(state)), 400
+
+        details, error = register_book(
+            file_path,
+            state["file_type"],
+            state["filename"],
+            state["metadata"],
+            uploads.upload_index(state, file_path, app.config["WORDS_PER_PAGE"]),
+        )
+        if error:
+            return jsonify(error=error), 400
+        return jsonify(sha256=digest, **details), 201
+
     @app.route("/settings")
     def settings():
-        settings_data = get_settings()
-        return render_template("settings.html", settings=settings_data)
+        user_id = current_user_id()
+        return render_template(
+            "settings.html",
+            settings=get_user_settings(user_id),
+            reader=get_user(user_id),
+        )
+
+    @app.route("/settings/reader", methods=["POST"])
+    def settings_reader():
+        email = request.form.get("reader_email", "").strip()
+        if not email:
+            flash("Reader email cannot be empty.", "error")
+            return redirect(url_for("settings"))
+
+        user = get_user_by_email(email)
+        if user:
+            user_id = user["id"]
+            flash(f"Switched to {email}.", "success")
+        else:
+            user_id = create_user(email, request.form.get("reader_name", "").strip() or None)
+            flash(f"Added reader {email}.", "success")
+        session["user_id"] = user_id
+        return redirect(url_for("settings"))
 
     @app.route("/settings/default", methods=["POST"])
     def settings_default():
@@ -132,7 +318,7 @@ def create_app():
             flash("Default pages per day must be a positive number.", "error")
             return redirect(url_for("settings"))
 
-        set_setting("default_pages_per_day", str(value_int))
+        set_user_setting(current_user_id(), "default_pages_per_day", str(value_int))
         flash("Default pages per day updated.", "success")
         return redirect(url_for("settings"))
 
@@ -143,51 +329,155 @@ def create_app():
             flash("Email address cannot be empty.", "error")
             return redirect(url_for("settings"))
 
-        set_setting("email_address", value)
+        user = get_user_by_email(value)
+        if user and user["id"] != current_user_id():
+            flash("Another reader already uses that email address.", "error")
+            return redirect(url_for("settings"))
+
+        set_user_email(current_user_id(), value)
         flash("Email address updated.", "success")
         return redirect(url_for("settings"))
 
+    @app.route("/settings/delivery", methods=["POST"])
+    def settings_delivery():
+        value = request.form.get("delivery_mode", "").strip()
+        if value not in {"book", "digest"}:
+            flash("Choose a valid delivery mode.", "error")
+            return redirect(url_for("settings"))
+
+        set_user_setting(current_user_id(), "delivery_mode", value)
+        flash("Delivery mode updated.", "success")
+        return redirect(url_for("settings"))
+
+    @app.route("/settings/profiling", methods=["POST"])
+    def settings_profiling():
+        targets = [
+            target for target in profiling.TARGETS if request.form.get(f"profile_{target}")
+        ]
+        set_setting("profile_targets", ",".join(targets))
+        flash("Profiling settings updated.", "success")
+        return redirect(url_for("settings"))
+
     @app.route("/settings/test", methods=["POST"])
     def settings_test_email():
-        settings_data = get_settings()
+        settings_data = get_user_settings(current_user_id())
         recipient = settings_data.get("email_address") or app.config["EMAIL_ADDRESS"]
-        if not app.config["EMAIL_PASSWORD"]:
-            flash("Missing GMAIL_APP_PASSWORD.", "error")
-            return redirect(url_for("settings"))
-
-        msg = EmailMessage()
-        msg["Subject"] = "[DailyLit] Test Email"
-        msg["From"] = app.config["EMAIL_ADDRESS"]
-        msg["To"] = recipient
-        msg.set_content("This is a test email from DailyLit Redux.")
+        msg = build_message(
+            "[DailyLit] Test Email",
+            "This is a test email from DailyLit Redux.",
+            None,
+            recipient,
+        )
 
         try:
-            with smtplib.SMTP(app.config["SMTP_SERVER"], app.config["SMTP_PORT"]) as smtp:
-                smtp.starttls()
-                smtp.login(app.config["EMAIL_ADDRESS"], app.config["EMAIL_PASSWORD"])
-                smtp.send_message(msg)
+            get_transport().send_message(msg)
             flash("Test email sent.", "success")
         except Exception as exc:
             flash(f"Test email failed: {exc}", "error")
 
         return redirect(url_for("settings"))
 
+    @app.route("/admin/profiles")
+    def admin_profiles():
+        return render_template(
+            "profiles.html",
+            profiles=profiling.list_profiles(),
+            enabled=profiling.enabled_targets(),
+        )
+
+    @app.route("/admin/profiles/<name>/<kind>")
+    def admin_profile_download(name, kind):
+        path = profiling.profile_path(name, f".{kind}")
+        if not path:
+            abort(404)
+        return send_file(path, as_attachment=True)
+
     @app.route("/book/<int:book_id>")
     def book_detail(book_id):
-        book = get_book_detail(book_id)
+        book = owned_book(book_id)
+        if not book:
+            flash("Book not found.", "error")
+            return redirect(url_for("index"))
         history = get_reading_history(book_id)
         return render_template(
             "book_detail.html",
             book=book,
             history=history,
+            summaries=get_history_summaries(book_id),
+            subscriptions=get_subscriptions(book_id),
         )
 
+    @app.route("/book/<int:book_id>/subscribers", methods=["POST"])
+    def book_subscribe(book_id):
+        book = owned_book(book_id)
+        if not book:
+            abort(404)
+        email = request.form.get("email", "").strip()
+        if not email:
+            flash("Subscriber email cannot be empty.", "error")
+            return redirect(url_for("book_detail", book_id=book_id))
+        try:
+            pages = max(1, int(request.form.get("pages_per_day", "")))
+        except ValueError:
+            pages = book["pages_per_day"]
+
+        user = get_user_by_email(email)
+        user_id = user["id"] if user else create_user(email)
+        if user_id == book["user_id"]:
+            flash("You already receive this book.", "error")
+            return redirect(url_for("book_detail", book_id=book_id))
+        add_subscription(book_id, user_id, pages)
+        flash(f"{email} now receives this book.", "success")
+        return redirect(url_for("book_detail", book_id=book_id))
+
+    @app.route("/book/<int:book_id>/subscribers/<int:subscription_id>/delete", methods=["POST"])
+    def book_unsubscribe(book_id, subscription_id):
+        require_book(book_id)
+        delete_subscription(subscription_id, book_id)
+        flash("Subscriber removed.", "success")
+        return redirect(url_for("book_detail", book_id=book_id))
+
+    @app.route("/book/<int:book_id>/page/<int:page>")
+    def book_page(book_id, page):
+        book = owned_book(book_id)
+        if not book:
+            flash("Book not found.", "error")
+            return redirect(url_for("index"))
+        if page < 1 or page > (book["total_pages"] or 0):
+            flash("Page out of range.", "error")
+            return redirect(url_for("book_detail", book_id=book_id))
+
+        count = request.args.get("count", 1, type=int)
+        count = max(1, min(count, app.config["PAGE_PREVIEW_MAX_COUNT"]))
+        last_page = min(page + count - 1, book["total_pages"])
+        try:
+            pages = get_pages(book, page, last_page)
+        except Exception as exc:
+            flash(f"Unable to load page: {exc}", "error")
+            return redirect(url_for("book_detail", book_id=book_id))
+
+        return render_template(
+            "page.html",
+            book=book,
+            pages=pages,
+            first_page=page,
+            last_page=page + len(pages) - 1,
+            count=count,
+        )
+
+    @app.route("/book/<int:book_id>/page")
+    def book_page_jump(book_id):
+        page = request.args.get("page", 1, type=int)
+        count = request.args.get("count", 1, type=int)
+        return redirect(url_for("book_page", book_id=book_id, page=page, count=count))
+
     @app.route("/book/<int:book_id>/status", methods=["POST"])
     def book_status(book_id):
         status = request.form.get("status", "").strip().lower()
         if status not in {"active", "paused", "completed"}:
             flash("Invalid status.", "error")
             return redirect(url_for("book_detail", book_id=book_id))
+        require_book(book_id)
         set_book_status(book_id, status)
         flash("Status updated.", "success")
         return redirect(url_for("book_detail", book_id=book_id))
@@ -204,15 +494,18 @@ def create_app():
             flash("Pages per day must be a positive number.", "error")
             return redirect(url_for("book_detail", book_id=book_id))
 
+        require_book(book_id)
         update_pages_per_day(book_id, pages)
         flash("Pages per day updated.", "success")
         return redirect(url_for("book_detail", book_id=book_id))
 
     @app.route("/book/<int:book_id>/delete", methods=["POST"])
     def book_delete(book_id):
-        book = get_book_detail(book_id)
+        book = owned_book(book_id)
+        if not book:
+            abort(404)
         delete_book(book_id)
-        if book and book["file_path"] and os.path.exists(book["file_path"]):
+        if book["file_path"] and os.path.exists(book["file_path"]):
             try:
                 os.remove(book["file_path"])
             except OSError:
@@ -222,7 +515,7 @@ def create_app():
 
     @app.route("/book/<int:book_id>/send", methods=["POST"])
     def book_send_now(book_id):
-        book = get_book_detail(book_id)
+        book = owned_book(book_id)
         if not book:
             flash("Book not found.", "error")
             return redirect(url_for("index"))
@@ -233,12 +526,14 @@ def create_app():
 
     @app.route("/book/<int:book_id>/reset", methods=["POST"])
     def book_reset(book_id):
+        require_book(book_id)
         reset_progress(book_id)
         flash("Progress reset.", "success")
         return redirect(url_for("book_detail", book_id=book_id))
 
     @app.route("/book/<int:book_id>/complete", methods=["POST"])
     def book_complete(book_id):
+        require_book(book_id)
         mark_book_completed(book_id)
         flash("Book marked complete.", "success")
         return redirect(url_for("book_detail", book_id=book_id))
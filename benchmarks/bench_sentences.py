@@ -0,0 +1,43 @@
+import argparse
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from text_processing import load_sentence_rules, parse_sentence_rules  # noqa: E402
+
+SAMPLE = (
+    "Mr. Smith met Dr. Jones at 5 p.m. on Jan. 3. They talked, e.g. about J. R. R. Tolkien... "
+    "and then left. It rained! Did it stop? Nobody knew. "
+)
+
+
+def time_split(rules, text, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rules.split(text)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure sentence splitting as abbreviation lists grow.")
+    parser.add_argument("--kb", type=int, default=512, help="Size of the sample text in KB.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    text = SAMPLE * max(1, args.kb * 1024 // len(SAMPLE))
+    base = load_sentence_rules("en")
+    print(f"{len(base.abbreviations):>6} abbreviations  {time_split(base, text, args.repeat):8.1f} ms")
+    for extra in (1000, 10000):
+        entries = sorted(base.abbreviations) + [f"abbr{number}." for number in range(extra)]
+        rules = parse_sentence_rules("bench", "[abbreviations]\n" + "\n".join(entries) + "\n[rules]\ninitials\nellipsis")
+        print(f"{len(rules.abbreviations):>6} abbreviations  {time_split(rules, text, args.repeat):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
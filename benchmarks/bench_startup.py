@@ -0,0 +1,61 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "import scheduler": "import scheduler",
+    "scheduler run (nothing due)": "import scheduler; scheduler.process_books()",
+    "create_app": "from app import create_app; create_app()",
+}
+
+_HARNESS = """
+import time
+_started = time.perf_counter()
+from config import Config
+Config.DATABASE_PATH = {db_path!r}
+from db import init_db
+init_db()
+{body}
+print(time.perf_counter() - _started)
+"""
+
+
+def run_scenario(body, db_path, repeat):
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _HARNESS.format(db_path=db_path, body=body)],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]) * 1000)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the app and scheduler.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        # The first run migrates; every measured run afterwards sees a current schema.
+        run_scenario("pass", db_path, 1)
+        for name, body in SCENARIOS.items():
+            timings = run_scenario(body, db_path, args.repeat)
+            print(
+                f"{name:<30} median {statistics.median(timings):7.1f} ms  "
+                f"min {min(timings):7.1f} ms  max {max(timings):7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -14,20 +14,62 @@ class Config:
 
     # File Storage
     UPLOAD_FOLDER = os.path.join("data", "uploads")
-    ALLOWED_EXTENSIONS = {"txt", "pdf"}
-    MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB max file size
+    ALLOWED_EXTENSIONS = {"txt", "pdf", "epub"}
+    MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB max request size
+    MAX_UPLOAD_SIZE = 500 * 1024 * 1024  # 500MB max file size for chunked uploads
+    UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+    UPLOAD_EXPIRY_SECONDS = 24 * 3600  # unfinished chunked uploads are dropped after this
 
     # Email
     SMTP_SERVER = "smtp.gmail.com"
     SMTP_PORT = 587
     EMAIL_ADDRESS = os.getenv("GMAIL_ADDRESS", "crog62@gmail.com")
     EMAIL_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
+    # smtp, file (.eml files in MAIL_FILE_DIR), null (count only) or memory
+    MAIL_TRANSPORT = os.getenv("DAILYLIT_MAIL_TRANSPORT", "smtp")
+    MAIL_FILE_DIR = os.path.join("data", "outbox")
 
     # Chunking
     WORDS_PER_PAGE = 400
+    # Books estimated to need more than this in memory are paginated and
+    # delivered by streaming instead of being loaded whole
+    BOOK_MEMORY_BUDGET = int(os.getenv("DAILYLIT_BOOK_MEMORY_MB", "128")) * 1024 * 1024
+    TRACK_BOOK_MEMORY = os.getenv("DAILYLIT_TRACK_MEMORY", "1").strip() == "1"
+    # Picks sentence_rules/<language>.txt; unknown languages fall back to English
+    SENTENCE_LANGUAGE = os.getenv("DAILYLIT_LANGUAGE", "en")
 
     # Scheduling
     SEND_TIME = time(2, 0)  # 2:00 AM
+    SCHEDULER_BATCH_SIZE = 20
+    # Longer than the worst-case send retries so a lease never lapses mid-book
+    SCHEDULER_LEASE_SECONDS = 30 * 60
+    # A book behind by missed runs gets up to this many days of pages at once
+    SCHEDULER_CATCH_UP_DAYS = 3
+    # Subscriber copies of one rendered delivery sent per SMTP batch
+    SUBSCRIPTION_SEND_BATCH = 50
 
     # Defaults
     DEFAULT_PAGES_PER_DAY = 1
+
+    # Caching
+    FRAGMENT_CACHE_SECONDS = 30
+    QUERY_CACHE_SECONDS = 60
+    QUERY_CACHE_ENTRIES = 256
+    CACHE_VERSION_CHECK_SECONDS = 1
+    PAGE_CACHE_BYTES = 32 * 1024 * 1024
+    PAGE_PREFETCH = 3
+    PAGE_PREVIEW_MAX_COUNT = 10
+
+    # Maintenance
+    BACKUP_DIR = os.path.join("data", "backups")
+    BACKUP_KEEP = 7
+    # Pages copied per backup step; the database is unlocked between steps.
+    BACKUP_PAGES_PER_STEP = 256
+    BACKUP_STEP_SLEEP = 0.05
+    HISTORY_RETENTION_DAYS = 365
+    VACUUM_PAGES_PER_STEP = 256
+
+    # Profiling (targets come from DAILYLIT_PROFILE or the profile_targets setting)
+    PROFILE_REQUEST_SAMPLE_RATE = float(os.getenv("DAILYLIT_PROFILE_SAMPLE", "0.1"))
+    PROFILE_TRACEMALLOC_FRAMES = 10
+    PROFILE_KEEP = 50
@@ -1,9 +1,17 @@
+import json
 import os
 import sqlite3
-from datetime import date
+import time
+from array import array
+from datetime import date, timedelta
 
+from cache import TTLCache
 from config import Config
-from migrations import migrate
+from migrations import migrate, schema_is_current
+
+
+_query_cache = TTLCache(ttl=Config.QUERY_CACHE_SECONDS, max_entries=Config.QUERY_CACHE_ENTRIES)
+_versions = {}
 
 
 def get_connection():
@@ -13,90 +21,105 @@ def get_connection():
     return conn
 
 
+def get_cache_version(scope):
+    key = (Config.DATABASE_PATH, scope)
+    checked = _versions.get(key)
+    now = time.monotonic()
+    if checked and now - checked[0] < Config.CACHE_VERSION_CHECK_SECONDS:
+        return checked[1]
+
+    # Other processes (the scheduler, other web workers) bump the same row,
+    # so re-reading it is what invalidates their writes here.
+    conn = get_connection()
+    try:
+        row = conn.execute(
+            "SELECT version FROM cache_versions WHERE scope = ?;",
+            (scope,),
+        ).fetchone()
+    finally:
+        conn.close()
+    version = row["version"] if row else 0
+    _versions[key] = (now, version)
+    return version
+
+
+def _bump_versions(conn, *scopes):
+    versions = {}
+    for scope in scopes:
+        conn.execute(
+            "UPDATE cache_versions SET version = version + 1 WHERE scope = ?;",
+            (scope,),
+        )
+        row = conn.execute(
+            "SELECT version FROM cache_versions WHERE scope = ?;",
+            (scope,),
+        ).fetchone()
+        versions[scope] = row["version"] if row else 0
+    return versions
+
+
+def _remember_versions(versions):
+    now = time.monotonic()
+    for scope, version in versions.items():
+        _versions[(Config.DATABASE_PATH, scope)] = (now, version)
+
+
+def _commit(conn, *scopes):
+    versions = _bump_versions(conn, *scopes)
+    conn.commit()
+    # Only publish the new versions once the data is visible, so a concurrent
+    # reader can't cache pre-commit rows under the new version.
+    _remember_versions(versions)
+
+
+def _cached(scope, key, loader):
+    cache_key = (Config.DATABASE_PATH, scope, get_cache_version(scope), key)
+    return _query_cache.get_or_set(cache_key, loader)
+
+
 def init_db():
-    migrate()
     db_dir = os.path.dirname(Config.DATABASE_PATH)
     if db_dir:
         os.makedirs(db_dir, exist_ok=True)
 
     conn = get_connection()
     try:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS books (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                author TEXT,
-                filename TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                file_type TEXT NOT NULL,
-                total_words INTEGER,
-                total_pages INTEGER,
-                upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'active' CHECK (status IN ('active', 'paused', 'completed'))
-            );
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS reading_progress (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                book_id INTEGER NOT NULL,
-                current_page INTEGER DEFAULT 0,
-                current_word_position INTEGER DEFAULT 0,
-                pages_per_day INTEGER DEFAULT 1 CHECK (pages_per_day >= 1),
-                last_sent_date DATE,
-                completed_date DATE,
-                FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
-            );
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS reading_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                book_id INTEGER NOT NULL,
-                sent_date DATE NOT NULL,
-                start_page INTEGER NOT NULL,
-                end_page INTEGER NOT NULL,
-                word_start INTEGER NOT NULL,
-                word_end INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
-            );
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT NOT NULL
-            );
-            """
-        )
+        current = schema_is_current(conn)
+    finally:
+        conn.close()
+    if not current:
+        migrate()
+        _insert_default_settings()
 
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_books_status ON books(status);"
-        )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_progress_book_id ON reading_progress(book_id);"
-        )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_history_book_date ON reading_history(book_id, sent_date);"
-        )
 
+def _insert_default_settings():
+    conn = get_connection()
+    try:
         defaults = {
             "default_pages_per_day": str(Config.DEFAULT_PAGES_PER_DAY),
             "send_time": Config.SEND_TIME.strftime("%H:%M"),
             "email_address": Config.EMAIL_ADDRESS,
             "timezone": "local",
+            "delivery_mode": "book",
         }
         for key, value in defaults.items():
             conn.execute(
                 "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?);",
                 (key, value),
             )
-        conn.commit()
+        # A fresh database (or one without a configured address) gets its
+        # first reader here; books from before readers existed go to them.
+        conn.execute(
+            """
+            INSERT INTO users (email)
+            SELECT value FROM settings
+            WHERE key = 'email_address' AND NOT EXISTS (SELECT 1 FROM users);
+            """
+        )
+        conn.execute(
+            "UPDATE books SET user_id = (SELECT MIN(id) FROM users) WHERE user_id IS NULL;"
+        )
+        _commit(conn, "settings", "books")
     finally:
         conn.close()
 
@@ -109,23 +132,30 @@ def insert_book(
     file_type,
     total_words,
     total_pages,
+    memory_estimate=None,
+    user_id=None,
 ):
+    user_id = user_id or default_user_id()
     conn = get_connection()
     try:
         cursor = conn.execute(
             """
             INSERT INTO books (
+                user_id,
                 title,
                 author,
                 filename,
                 file_path,
                 file_type,
                 total_words,
-                total_pages
+                total_pages,
+                next_due_date,
+                memory_estimate
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?);
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
             """,
             (
+                user_id,
                 title,
                 author,
                 filename,
@@ -133,9 +163,11 @@ def insert_book(
                 file_type,
                 total_words,
                 total_pages,
+                date.today().isoformat(),
+                memory_estimate,
             ),
         )
-        conn.commit()
+        _commit(conn, "books")
         return cursor.lastrowid
     finally:
         conn.close()
@@ -151,12 +183,81 @@ def insert_progress(book_id, pages_per_day):
             """,
             (book_id, pages_per_day),
         )
-        conn.commit()
+        _commit(conn, "books")
+    finally:
+        conn.close()
+
+
+def insert_books(records):
+    today = date.today().isoformat()
+    fallback_owner = None if all(record.get("user_id") for record in records) else default_user_id()
+    conn = get_connection()
+    try:
+        book_ids = []
+        with conn:
+            for record in records:
+                cursor = conn.execute(
+                    """
+                    INSERT INTO books (
+                        user_id,
+                        title,
+                        author,
+                        filename,
+                        file_path,
+                        file_type,
+                        total_words,
+                        total_pages,
+                        next_due_date,
+                        memory_estimate
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+                    """,
+                    (
+                        record.get("user_id") or fallback_owner,
+                        record["title"],
+                        record["author"],
+                        record["filename"],
+                        record["file_path"],
+                        record["file_type"],
+                        record["total_words"],
+                        record["total_pages"],
+                        today,
+                        record.get("memory_estimate"),
+                    ),
+                )
+                book_id = cursor.lastrowid
+                conn.execute(
+                    """
+                    INSERT INTO reading_progress (book_id, pages_per_day)
+                    VALUES (?, ?);
+                    """,
+                    (book_id, record["pages_per_day"]),
+                )
+                index = record.get("index")
+                if index:
+                    conn.execute(
+                        """
+                        INSERT INTO book_index (book_id, page_words, page_sources, source_words, page_offsets)
+                        VALUES (?, ?, ?, ?, ?);
+                        """,
+                        _index_row(book_id, index),
+                    )
+                if record.get("units"):
+                    _insert_book_units(conn, book_id, record["units"])
+                book_ids.append(book_id)
+            versions = _bump_versions(conn, "books")
+        _remember_versions(versions)
+        return book_ids
     finally:
         conn.close()
 
 
-def get_books_with_progress():
+def get_books_with_progress(user_id=None):
+    user_id = user_id or default_user_id()
+    return list(_cached("books", ("library", user_id), lambda: _load_books_with_progress(user_id)))
+
+
+def _load_books_with_progress(user_id):
     conn = get_connection()
     try:
         cursor = conn.execute(
@@ -171,15 +272,25 @@ def get_books_with_progress():
                 reading_progress.pages_per_day
             FROM books
             JOIN reading_progress ON reading_progress.book_id = books.id
+            WHERE books.user_id = ?
             ORDER BY books.upload_date DESC;
-            """
+            """,
+            (user_id,),
         )
         return cursor.fetchall()
     finally:
         conn.close()
 
 
-def get_book_detail(book_id):
+def get_book_detail(book_id, user_id=None):
+    """A book with its progress; with ``user_id``, only if that reader owns it."""
+    book = _cached("books", ("detail", book_id), lambda: _load_book_detail(book_id))
+    if book is not None and user_id is not None and book["user_id"] != user_id:
+        return None
+    return book
+
+
+def _load_book_detail(book_id):
     conn = get_connection()
     try:
         cursor = conn.execute(
@@ -194,11 +305,15 @@ def get_book_detail(book_id):
                 books.total_pages,
                 books.status,
                 books.upload_date,
+                books.user_id,
                 reading_progress.current_page,
                 reading_progress.current_word_position,
                 reading_progress.pages_per_day,
                 reading_progress.last_sent_date,
-                reading_progress.completed_date
+                reading_progress.completed_date,
+                books.next_due_date,
+                books.memory_estimate,
+                books.peak_memory
             FROM books
             JOIN reading_progress ON reading_progress.book_id = books.id
             WHERE books.id = ?;
@@ -228,14 +343,89 @@ def get_reading_history(book_id, limit=30):
         conn.close()
 
 
-def set_book_status(book_id, status):
+def get_history_summaries(book_id):
     conn = get_connection()
     try:
-        conn.execute(
-            "UPDATE books SET status = ? WHERE id = ?;",
-            (status, book_id),
+        cursor = conn.execute(
+            """
+            SELECT month, deliveries, pages, words, first_sent_date, last_sent_date
+            FROM history_summaries
+            WHERE book_id = ?
+            ORDER BY month DESC;
+            """,
+            (book_id,),
         )
-        conn.commit()
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def compact_history(before_date):
+    """Roll reading history sent before ``before_date`` into monthly summaries."""
+    conn = get_connection()
+    try:
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO history_summaries (
+                    book_id,
+                    month,
+                    deliveries,
+                    pages,
+                    words,
+                    first_sent_date,
+                    last_sent_date
+                )
+                SELECT
+                    book_id,
+                    substr(sent_date, 1, 7),
+                    COUNT(*),
+                    SUM(end_page - start_page + 1),
+                    SUM(word_end - word_start + 1),
+                    MIN(sent_date),
+                    MAX(sent_date)
+                FROM reading_history
+                WHERE sent_date < ?
+                GROUP BY book_id, substr(sent_date, 1, 7)
+                ON CONFLICT(book_id, month) DO UPDATE SET
+                    deliveries = deliveries + excluded.deliveries,
+                    pages = pages + excluded.pages,
+                    words = words + excluded.words,
+                    first_sent_date = MIN(first_sent_date, excluded.first_sent_date),
+                    last_sent_date = MAX(last_sent_date, excluded.last_sent_date);
+                """,
+                (before_date,),
+            )
+            cursor = conn.execute(
+                "DELETE FROM reading_history WHERE sent_date < ?;",
+                (before_date,),
+            )
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+def _next_due_date(last_sent_date):
+    if not last_sent_date:
+        return date.today().isoformat()
+    return (date.fromisoformat(last_sent_date) + timedelta(days=1)).isoformat()
+
+
+def set_book_status(book_id, status):
+    conn = get_connection()
+    try:
+        if status == "active":
+            # Days spent paused are not owed, so a resumed book is due from today.
+            conn.execute(
+                "UPDATE books SET status = ?, next_due_date = MAX(next_due_date, ?) WHERE id = ?;",
+                (status, date.today().isoformat(), book_id),
+            )
+        else:
+            conn.execute(
+                "UPDATE books SET status = ? WHERE id = ?;",
+                (status, book_id),
+            )
+        _commit(conn, "books")
     finally:
         conn.close()
 
@@ -251,7 +441,26 @@ def update_pages_per_day(book_id, pages_per_day):
             """,
             (pages_per_day, book_id),
         )
-        conn.commit()
+        _commit(conn, "books")
+    finally:
+        conn.close()
+
+
+def record_book_memory(book_id, peak_memory):
+    # The estimate only ratchets up, so a book that once overran its budget
+    # stays on the streaming path even though streamed runs peak lower.
+    conn = get_connection()
+    try:
+        conn.execute(
+            """
+            UPDATE books
+            SET peak_memory = ?,
+                memory_estimate = MAX(COALESCE(memory_estimate, 0), ?)
+            WHERE id = ?;
+            """,
+            (peak_memory, peak_memory, book_id),
+        )
+        _commit(conn, "books")
     finally:
         conn.close()
 
@@ -260,7 +469,7 @@ def delete_book(book_id):
     conn = get_connection()
     try:
         conn.execute("DELETE FROM books WHERE id = ?;", (book_id,))
-        conn.commit()
+        _commit(conn, "books")
     finally:
         conn.close()
 
@@ -278,10 +487,14 @@ def get_active_books():
                 books.file_type,
                 books.total_pages,
                 books.status,
+                books.user_id,
                 reading_progress.current_page,
                 reading_progress.current_word_position,
                 reading_progress.pages_per_day,
-                reading_progress.last_sent_date
+                reading_progress.last_sent_date,
+                books.next_due_date,
+                books.memory_estimate,
+                books.peak_memory
             FROM books
             JOIN reading_progress ON reading_progress.book_id = books.id
             WHERE books.status = 'active'
@@ -293,6 +506,285 @@ def get_active_books():
         conn.close()
 
 
+def claim_due_books(worker_id, today, limit=20, lease_seconds=None, exclude=()):
+    """Lease up to ``limit`` due books, skipping the ids in ``exclude``."""
+    lease_seconds = lease_seconds or Config.SCHEDULER_LEASE_SECONDS
+    conn = get_connection()
+    conn.isolation_level = None
+    try:
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can't
+        # both see the same book as unleased.
+        conn.execute("BEGIN IMMEDIATE;")
+        now = time.time()
+        try:
+            rows = conn.execute(
+                """
+                SELECT
+                    books.id,
+                    books.title,
+                    books.author,
+                    books.file_path,
+                    books.file_type,
+                    books.total_pages,
+                    books.status,
+                    books.user_id,
+                    reading_progress.current_page,
+                    reading_progress.current_word_position,
+                    reading_progress.pages_per_day,
+                    reading_progress.last_sent_date,
+                    books.next_due_date,
+                    books.memory_estimate,
+                    books.peak_memory
+                FROM books
+                JOIN reading_progress ON reading_progress.book_id = books.id
+                LEFT JOIN book_leases ON book_leases.book_id = books.id
+                WHERE books.status = 'active'
+                  AND books.next_due_date <= ?
+                  AND (book_leases.book_id IS NULL OR book_leases.expires_at < ?)
+                  AND books.id NOT IN (SELECT value FROM json_each(?))
+                ORDER BY books.next_due_date, books.id
+                LIMIT ?;
+                """,
+                (today, now, json.dumps(sorted(exclude)), limit),
+            ).fetchall()
+            conn.executemany(
+                """
+                INSERT INTO book_leases (book_id, worker_id, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(book_id) DO UPDATE SET
+                    worker_id = excluded.worker_id,
+                    expires_at = excluded.expires_at;
+                """,
+                [(row["id"], worker_id, now + lease_seconds) for row in rows],
+            )
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+        return rows
+    finally:
+        conn.close()
+
+
+def renew_book_lease(book_id, worker_id, lease_seconds=None):
+    """Extend this worker's lease on a book and return its current row.
+
+    Returns None when the lease was lost to another worker (or released),
+    so the caller must not deliver the book.
+    """
+    lease_seconds = lease_seconds or Config.SCHEDULER_LEASE_SECONDS
+    conn = get_connection()
+    try:
+        with conn:
+            cursor = conn.execute(
+                "UPDATE book_leases SET expires_at = ? WHERE book_id = ? AND worker_id = ?;",
+                (time.time() + lease_seconds, book_id, worker_id),
+            )
+            if cursor.rowcount == 0:
+                return None
+            return conn.execute(
+                """
+                SELECT
+                    books.id,
+                    books.title,
+                    books.author,
+                    books.file_path,
+                    books.file_type,
+                    books.total_pages,
+                    books.status,
+                    books.user_id,
+                    reading_progress.current_page,
+                    reading_progress.current_word_position,
+                    reading_progress.pages_per_day,
+                    reading_progress.last_sent_date,
+                    books.next_due_date,
+                    books.memory_estimate,
+                    books.peak_memory
+                FROM books
+                JOIN reading_progress ON reading_progress.book_id = books.id
+                WHERE books.id = ?;
+                """,
+                (book_id,),
+            ).fetchone()
+    finally:
+        conn.close()
+
+
+def release_book(book_id, worker_id):
+    conn = get_connection()
+    try:
+        conn.execute(
+            "DELETE FROM book_leases WHERE book_id = ? AND worker_id = ?;",
+            (book_id, worker_id),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def add_subscription(book_id, user_id, pages_per_day):
+    """Subscribe a reader to a book with their own progress; returns the subscription id."""
+    conn = get_connection()
+    try:
+        conn.execute(
+            """
+            INSERT INTO subscriptions (book_id, user_id, pages_per_day, next_due_date)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(book_id, user_id) DO UPDATE SET
+                pages_per_day = excluded.pages_per_day,
+                status = 'active',
+                next_due_date = MAX(next_due_date, excluded.next_due_date);
+            """,
+            (book_id, user_id, pages_per_day, date.today().isoformat()),
+        )
+        row = conn.execute(
+            "SELECT id FROM subscriptions WHERE book_id = ? AND user_id = ?;",
+            (book_id, user_id),
+        ).fetchone()
+        _commit(conn, "books")
+        return row["id"]
+    finally:
+        conn.close()
+
+
+def get_subscriptions(book_id):
+    conn = get_connection()
+    try:
+        cursor = conn.execute(
+            """
+            SELECT
+                subscriptions.id,
+                subscriptions.user_id,
+                users.email,
+                subscriptions.status,
+                subscriptions.current_page,
+                subscriptions.pages_per_day,
+                subscriptions.last_sent_date
+            FROM subscriptions
+            JOIN users ON users.id = subscriptions.user_id
+            WHERE subscriptions.book_id = ?
+            ORDER BY subscriptions.user_id;
+            """,
+            (book_id,),
+        )
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def delete_subscription(subscription_id, book_id):
+    conn = get_connection()
+    try:
+        conn.execute(
+            "DELETE FROM subscriptions WHERE id = ? AND book_id = ?;",
+            (subscription_id, book_id),
+        )
+        _commit(conn, "books")
+    finally:
+        conn.close()
+
+
+def claim_due_subscriptions(worker_id, today, limit=20, lease_seconds=None):
+    """Lease due subscriptions like ``claim_due_books``, with their book and address."""
+    lease_seconds = lease_seconds or Config.SCHEDULER_LEASE_SECONDS
+    conn = get_connection()
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN IMMEDIATE;")
+        now = time.time()
+        try:
+            rows = conn.execute(
+                """
+                SELECT
+                    subscriptions.id,
+                    subscriptions.book_id,
+                    subscriptions.user_id,
+                    subscriptions.status,
+                    subscriptions.current_page,
+                    subscriptions.current_word_position,
+                    subscriptions.pages_per_day,
+                    subscriptions.last_sent_date,
+                    subscriptions.next_due_date,
+                    users.email,
+                    books.title,
+                    books.author,
+                    books.file_path,
+                    books.file_type,
+                    books.total_pages,
+                    books.memory_estimate,
+                    books.peak_memory
+                FROM subscriptions
+                JOIN books ON books.id = subscriptions.book_id
+                JOIN users ON users.id = subscriptions.user_id
+                LEFT JOIN subscription_leases ON subscription_leases.subscription_id = subscriptions.id
+                WHERE subscriptions.status = 'active'
+                  AND subscriptions.next_due_date <= ?
+                  AND (subscription_leases.subscription_id IS NULL OR subscription_leases.expires_at < ?)
+                ORDER BY subscriptions.next_due_date, subscriptions.id
+                LIMIT ?;
+                """,
+                (today, now, limit),
+            ).fetchall()
+            conn.executemany(
+                """
+                INSERT INTO subscription_leases (subscription_id, worker_id, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(subscription_id) DO UPDATE SET
+                    worker_id = excluded.worker_id,
+                    expires_at = excluded.expires_at;
+                """,
+                [(row["id"], worker_id, now + lease_seconds) for row in rows],
+            )
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+        return rows
+    finally:
+        conn.close()
+
+
+def advance_subscriptions(worker_id, deliveries):
+    """Record sent deliveries and release their leases in one transaction.
+
+    ``deliveries`` holds ``(subscription_id, current_page, current_word_position,
+    sent_date, completed_date)`` tuples; ``completed_date`` is None until the end.
+    """
+    conn = get_connection()
+    try:
+        with conn:
+            for subscription_id, current_page, word_position, sent_date, completed_date in deliveries:
+                conn.execute(
+                    """
+                    UPDATE subscriptions
+                    SET current_page = ?,
+                        current_word_position = ?,
+                        last_sent_date = ?,
+                        next_due_date = ?,
+                        completed_date = COALESCE(?, completed_date),
+                        status = CASE WHEN ? IS NULL THEN status ELSE 'completed' END
+                    WHERE id = ?;
+                    """,
+                    (
+                        current_page,
+                        word_position,
+                        sent_date,
+                        _next_due_date(sent_date),
+                        completed_date,
+                        completed_date,
+                        subscription_id,
+                    ),
+                )
+                conn.execute(
+                    "DELETE FROM subscription_leases WHERE subscription_id = ? AND worker_id = ?;",
+                    (subscription_id, worker_id),
+                )
+            versions = _bump_versions(conn, "books")
+        _remember_versions(versions)
+    finally:
+        conn.close()
+
+
 def reset_progress(book_id):
     conn = get_connection()
     try:
@@ -312,10 +804,10 @@ def reset_progress(book_id):
             (book_id,),
         )
         conn.execute(
-            "UPDATE books SET status = 'active' WHERE id = ?;",
-            (book_id,),
+            "UPDATE books SET status = 'active', next_due_date = ? WHERE id = ?;",
+            (_next_due_date(None), book_id),
         )
-        conn.commit()
+        _commit(conn, "books")
     finally:
         conn.close()
 
@@ -332,7 +824,7 @@ def mark_book_completed(book_id, completed_date=None):
             "UPDATE reading_progress SET completed_date = ? WHERE book_id = ?;",
             (completed_date, book_id),
         )
-        conn.commit()
+        _commit(conn, "books")
     finally:
         conn.close()
 
@@ -357,7 +849,11 @@ def update_progress(book_id, current_page, current_word_position, last_sent_date
                 book_id,
             ),
         )
-        conn.commit()
+        conn.execute(
+            "UPDATE books SET next_due_date = ? WHERE id = ?;",
+            (_next_due_date(last_sent_date), book_id),
+        )
+        _commit(conn, "books")
     finally:
         conn.close()
 
@@ -384,7 +880,289 @@ def insert_history(book_id, sent_date, start_page, end_page, word_start, word_en
         conn.close()
 
 
+def get_delivery(journal_id):
+    conn = get_connection()
+    try:
+        cursor = conn.execute(
+            "SELECT * FROM delivery_journal WHERE id = ?;",
+            (journal_id,),
+        )
+        return cursor.fetchone()
+    finally:
+        conn.close()
+
+
+def get_open_delivery(book_id):
+    conn = get_connection()
+    try:
+        cursor = conn.execute(
+            """
+            SELECT *
+            FROM delivery_journal
+            WHERE book_id = ? AND state != 'committed'
+            ORDER BY id DESC
+            LIMIT 1;
+            """,
+            (book_id,),
+        )
+        return cursor.fetchone()
+    finally:
+        conn.close()
+
+
+def plan_delivery(book_id, sent_date, start_page, end_page, kind="book"):
+    conn = get_connection()
+    try:
+        conn.execute(
+            "DELETE FROM delivery_journal WHERE book_id = ? AND state != 'committed';",
+            (book_id,),
+        )
+        cursor = conn.execute(
+            """
+            INSERT INTO delivery_journal (book_id, sent_date, state, start_page, end_page, kind)
+            VALUES (?, ?, 'planned', ?, ?, ?);
+            """,
+            (book_id, sent_date, start_page, end_page, kind),
+        )
+        conn.commit()
+        journal_id = cursor.lastrowid
+    finally:
+        conn.close()
+    return get_delivery(journal_id)
+
+
+def record_rendered_delivery(journal_id, recipient, word_start, word_end, subject, plain_body, html_body):
+    conn = get_connection()
+    try:
+        conn.execute(
+            """
+            UPDATE delivery_journal
+            SET state = 'rendered',
+                recipient = ?,
+                word_start = ?,
+                word_end = ?,
+                subject = ?,
+                plain_body = ?,
+                html_body = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?;
+            """,
+            (recipient, word_start, word_end, subject, plain_body, html_body, journal_id),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return get_delivery(journal_id)
+
+
+def mark_delivery_sent(journal_id):
+    mark_deliveries_sent([journal_id])
+    return get_delivery(journal_id)
+
+
+def mark_deliveries_sent(journal_ids):
+    conn = get_connection()
+    try:
+        conn.executemany(
+            """
+            UPDATE delivery_journal
+            SET state = 'sent', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?;
+            """,
+            [(journal_id,) for journal_id in journal_ids],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def commit_delivery(journal_id):
+    return commit_deliveries([journal_id])[0]
+
+
+def commit_deliveries(journal_ids):
+    conn = get_connection()
+    try:
+        with conn:
+            completed_dates = [_commit_delivery_entry(conn, journal_id) for journal_id in journal_ids]
+            versions = _bump_versions(conn, "books")
+        _remember_versions(versions)
+        return completed_dates
+    finally:
+        conn.close()
+
+
+def _commit_delivery_entry(conn, journal_id):
+    entry = conn.execute(
+        """
+        SELECT delivery_journal.*, books.total_pages
+        FROM delivery_journal
+        JOIN books ON books.id = delivery_journal.book_id
+        WHERE delivery_journal.id = ?;
+        """,
+        (journal_id,),
+    ).fetchone()
+    completed_date = entry["sent_date"] if entry["end_page"] >= entry["total_pages"] else None
+    conn.execute(
+        """
+        UPDATE reading_progress
+        SET current_page = ?,
+            current_word_position = ?,
+            last_sent_date = ?,
+            completed_date = ?
+        WHERE book_id = ?;
+        """,
+        (
+            entry["end_page"],
+            entry["word_end"],
+            entry["sent_date"],
+            completed_date,
+            entry["book_id"],
+        ),
+    )
+    conn.execute(
+        """
+        INSERT INTO reading_history (
+            book_id,
+            sent_date,
+            start_page,
+            end_page,
+            word_start,
+            word_end
+        )
+        VALUES (?, ?, ?, ?, ?, ?);
+        """,
+        (
+            entry["book_id"],
+            entry["sent_date"],
+            entry["start_page"],
+            entry["end_page"],
+            entry["word_start"],
+            entry["word_end"],
+        ),
+    )
+    conn.execute(
+        "UPDATE books SET next_due_date = ? WHERE id = ?;",
+        (_next_due_date(entry["sent_date"]), entry["book_id"]),
+    )
+    if completed_date:
+        conn.execute(
+            "UPDATE books SET status = 'completed' WHERE id = ?;",
+            (entry["book_id"],),
+        )
+    # The message bodies are only needed to resume an unsent delivery.
+    conn.execute(
+        """
+        UPDATE delivery_journal
+        SET state = 'committed',
+            plain_body = NULL,
+            html_body = NULL,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?;
+        """,
+        (journal_id,),
+    )
+    return completed_date
+
+
+def _index_row(book_id, index):
+    page_offsets = index.get("page_offsets")
+    return (
+        book_id,
+        index["page_words"].tobytes(),
+        index["page_sources"].tobytes(),
+        index["source_words"].tobytes(),
+        page_offsets.tobytes() if page_offsets is not None else None,
+    )
+
+
+def save_book_index(book_id, index):
+    conn = get_connection()
+    try:
+        conn.execute(
+            """
+            INSERT INTO book_index (book_id, page_words, page_sources, source_words, page_offsets)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(book_id) DO UPDATE SET
+                page_words = excluded.page_words,
+                page_sources = excluded.page_sources,
+                source_words = excluded.source_words,
+                page_offsets = excluded.page_offsets;
+            """,
+            _index_row(book_id, index),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_book_index(book_id):
+    conn = get_connection()
+    try:
+        row = conn.execute(
+            """
+            SELECT page_words, page_sources, source_words, page_offsets
+            FROM book_index
+            WHERE book_id = ?;
+            """,
+            (book_id,),
+        ).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    index = {}
+    for key in ("page_words", "page_sources", "source_words"):
+        values = array("I")
+        values.frombytes(row[key])
+        index[key] = values
+    if row["page_offsets"] is not None:
+        # Byte offsets need 64 bits; TXT books may be larger than 4 GB.
+        index["page_offsets"] = array("Q")
+        index["page_offsets"].frombytes(row["page_offsets"])
+    return index
+
+
+def _insert_book_units(conn, book_id, units):
+    conn.execute("DELETE FROM book_units WHERE book_id = ?;", (book_id,))
+    conn.executemany(
+        "INSERT INTO book_units (book_id, unit, text) VALUES (?, ?, ?);",
+        [(book_id, unit, text) for unit, text in enumerate(units)],
+    )
+
+
+def save_book_units(book_id, units):
+    conn = get_connection()
+    try:
+        with conn:
+            _insert_book_units(conn, book_id, units)
+    finally:
+        conn.close()
+
+
+def get_book_units(book_id, first, last):
+    """Cached source units ``first``..``last`` of a book, or None if none are cached."""
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            """
+            SELECT text
+            FROM book_units
+            WHERE book_id = ? AND unit BETWEEN ? AND ?
+            ORDER BY unit;
+            """,
+            (book_id, first, last),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [row["text"] for row in rows] or None
+
+
 def get_settings():
+    return dict(_cached("settings", ("all",), _load_settings))
+
+
+def _load_settings():
     conn = get_connection()
     try:
         cursor = conn.execute("SELECT key, value FROM settings;")
@@ -405,9 +1183,107 @@ def set_setting(key, value):
             """,
             (key, value),
         )
-        conn.commit()
+        _commit(conn, "settings")
+    finally:
+        conn.close()
+
+
+def default_user_id():
+    """The first reader, who owns anything added without an explicit owner."""
+    conn = get_connection()
+    try:
+        return conn.execute("SELECT MIN(id) AS id FROM users;").fetchone()["id"]
+    finally:
+        conn.close()
+
+
+def create_user(email, name=None):
+    conn = get_connection()
+    try:
+        cursor = conn.execute(
+            "INSERT INTO users (email, name) VALUES (?, ?);",
+            (email, name),
+        )
+        _commit(conn, "settings")
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+
+def get_user(user_id):
+    conn = get_connection()
+    try:
+        return conn.execute(
+            "SELECT id, email, name, created_at FROM users WHERE id = ?;",
+            (user_id,),
+        ).fetchone()
+    finally:
+        conn.close()
+
+
+def get_user_by_email(email):
+    conn = get_connection()
+    try:
+        return conn.execute(
+            "SELECT id, email, name, created_at FROM users WHERE email = ?;",
+            (email,),
+        ).fetchone()
+    finally:
+        conn.close()
+
+
+def set_user_email(user_id, email):
+    conn = get_connection()
+    try:
+        conn.execute(
+            "UPDATE users SET email = ? WHERE id = ?;",
+            (email, user_id),
+        )
+        _commit(conn, "settings")
+    finally:
+        conn.close()
+
+
+def get_user_settings(user_id):
+    """Instance-wide settings overlaid with one reader's own values and address."""
+    return dict(_cached("settings", ("user", user_id), lambda: _load_user_settings(user_id)))
+
+
+def _load_user_settings(user_id):
+    settings = get_settings()
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            "SELECT key, value FROM user_settings WHERE user_id = ?;",
+            (user_id,),
+        ).fetchall()
+        user = conn.execute(
+            "SELECT email FROM users WHERE id = ?;",
+            (user_id,),
+        ).fetchone()
     finally:
         conn.close()
+    settings.update((row["key"], row["value"]) for row in rows)
+    if user:
+        settings["email_address"] = user["email"]
+    return settings
+
+
+def set_user_setting(user_id, key, value):
+    conn = get_connection()
+    try:
+        conn.execute(
+            """
+            INSERT INTO user_settings (user_id, key, value)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id, key) DO UPDATE SET value = excluded.value;
+            """,
+            (user_id, key, value),
+        )
+        _commit(conn, "settings")
+    finally:
+        conn.close()
+
 
 if __name__ == "__main__":
     init_db()
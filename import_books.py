@@ -0,0 +1,200 @@
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from config import Config
+from db import create_user, default_user_id, get_user_by_email, get_user_settings, init_db, insert_books
+from text_processing import index_book
+from uploads import unique_upload_path
+
+
+def read_manifest(manifest_path):
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, "r", encoding="utf-8") as handle:
+        if manifest_path.lower().endswith(".json"):
+            rows = json.load(handle)
+        else:
+            rows = list(csv.DictReader(handle))
+
+    entries = []
+    for row in rows:
+        path = row.get("path") or row.get("file")
+        if not path:
+            continue
+        if not os.path.isabs(path):
+            path = os.path.join(base_dir, path)
+        entries.append(
+            {
+                "path": path,
+                "title": row.get("title") or None,
+                "author": row.get("author") or None,
+                "pages_per_day": row.get("pages_per_day") or None,
+            }
+        )
+    return entries
+
+
+def scan_directory(directory):
+    entries = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            entries.append(
+                {
+                    "path": os.path.join(root, name),
+                    "title": None,
+                    "author": None,
+                    "pages_per_day": None,
+                }
+            )
+    return entries
+
+
+def analyze_file(path, file_type, words_per_page):
+    started = time.perf_counter()
+    result = index_book(path, file_type, words_per_page)
+    if result["total_words"] == 0:
+        raise ValueError("No readable text found in the file.")
+    result["elapsed"] = time.perf_counter() - started
+    return result
+
+
+def _file_type(path):
+    return os.path.splitext(path)[1].lower().lstrip(".")
+
+
+def _pages_per_day(value, default):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def import_entries(
+    entries,
+    workers=None,
+    batch_size=200,
+    copy_files=True,
+    default_pages=None,
+    user_id=None,
+    out=sys.stdout,
+):
+    user_id = user_id or default_user_id()
+    if default_pages is None:
+        default_pages = get_user_settings(user_id).get("default_pages_per_day")
+    default_pages = _pages_per_day(default_pages, Config.DEFAULT_PAGES_PER_DAY)
+
+    failures = []
+    pending = []
+    imported = 0
+    reserved = set()
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal imported
+        if pending:
+            insert_books(pending)
+            imported += len(pending)
+            pending.clear()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for entry in entries:
+            file_type = _file_type(entry["path"])
+            if file_type not in Config.ALLOWED_EXTENSIONS:
+                failures.append((entry["path"], "Unsupported file type."))
+                print(f"SKIP {entry['path']}: unsupported file type", file=out)
+                continue
+            future = executor.submit(analyze_file, entry["path"], file_type, Config.WORDS_PER_PAGE)
+            futures[future] = (entry, file_type)
+
+        for future in as_completed(futures):
+            # Drop each finished future so its result (with any cached PDF
+            # pages) is freed once the batch it joins is flushed.
+            entry, file_type = futures.pop(future)
+            try:
+                result = future.result()
+            except Exception as exc:
+                failures.append((entry["path"], str(exc)))
+                print(f"FAIL {entry['path']}: {exc}", file=out)
+                continue
+
+            file_path = os.path.abspath(entry["path"])
+            filename = os.path.basename(file_path)
+            if copy_files:
+                file_path = unique_upload_path(filename, file_type, reserved)
+                reserved.add(file_path)
+                shutil.copy2(entry["path"], file_path)
+
+            title = entry["title"] or os.path.splitext(filename)[0]
+            pending.append(
+                {
+                    "user_id": user_id,
+                    "title": title,
+                    "author": entry["author"],
+                    "filename": os.path.basename(file_path),
+                    "file_path": file_path,
+                    "file_type": file_type,
+                    "total_words": result["total_words"],
+                    "total_pages": result["total_pages"],
+                    "pages_per_day": _pages_per_day(entry["pages_per_day"], default_pages),
+                    "index": result["index"],
+                    "units": result["units"],
+                    "memory_estimate": result["memory_estimate"],
+                }
+            )
+            print(
+                f"OK   {entry['path']}: {result['total_words']} words, "
+                f"{result['total_pages']} pages in {result['elapsed']:.2f}s",
+                file=out,
+            )
+            if len(pending) >= batch_size:
+                flush()
+    flush()
+
+    elapsed = time.perf_counter() - started
+    print(f"Imported {imported} book(s), {len(failures)} failure(s) in {elapsed:.2f}s.", file=out)
+    return imported, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import many books into DailyLit at once.")
+    parser.add_argument("source", help="Directory of book files, or a .csv/.json manifest.")
+    parser.add_argument("--pages-per-day", type=int, help="Pages per day for entries without one.")
+    parser.add_argument("--workers", type=int, help="Parallel extraction processes (default: CPU count).")
+    parser.add_argument("--batch-size", type=int, default=200, help="Books inserted per transaction.")
+    parser.add_argument(
+        "--no-copy",
+        action="store_true",
+        help="Reference files where they are instead of copying them into the upload folder.",
+    )
+    parser.add_argument("--user", help="Email of the reader who owns the books (created if new).")
+    args = parser.parse_args(argv)
+
+    init_db()
+    user_id = None
+    if args.user:
+        user = get_user_by_email(args.user)
+        user_id = user["id"] if user else create_user(args.user)
+    if os.path.isdir(args.source):
+        entries = scan_directory(args.source)
+    else:
+        entries = read_manifest(args.source)
+
+    _, failures = import_entries(
+        entries,
+        workers=args.workers,
+        batch_size=max(1, args.batch_size),
+        copy_files=not args.no_copy,
+        default_pages=args.pages_per_day,
+        user_id=user_id,
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+import uuid
+
+from config import Config
+
+
+def build_message(subject, plain, html, recipient, sender=None):
+    from email.message import EmailMessage
+
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = sender or Config.EMAIL_ADDRESS
+    msg["To"] = recipient
+    msg.set_content(plain)
+    if html:
+        msg.add_alternative(html, subtype="html")
+    return msg
+
+
+class PartialSendError(Exception):
+    """Some messages of a batch went out and some did not.
+
+    ``sent`` holds the indexes of the delivered messages and ``failed`` maps
+    the indexes of refused or failed ones to their error. Messages in
+    neither were not attempted.
+    """
+
+    def __init__(self, sent, failed):
+        self.sent = sent
+        self.failed = failed
+        super().__init__(
+            f"{len(sent)} sent, {len(failed)} failed: "
+            + "; ".join(f"#{index}: {error}" for index, error in failed.items())
+        )
+
+
+class MailTransport:
+    name = None
+
+    def send_message(self, msg):
+        return self.send_messages([msg])
+
+    def send_messages(self, messages):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class SMTPTransport(MailTransport):
+    name = "smtp"
+    # Servers drop idle sessions; past this a pooled connection is re-checked.
+    IDLE_CHECK_SECONDS = 60
+
+    def __init__(self, server=None, port=None, username=None, password=None):
+        self.server = server or Config.SMTP_SERVER
+        self.port = port or Config.SMTP_PORT
+        self.username = username or Config.EMAIL_ADDRESS
+        self.password = password or Config.EMAIL_PASSWORD
+        self._smtp = None
+        self._last_used = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        import smtplib
+
+        if not self.password:
+            raise RuntimeError("Missing GMAIL_APP_PASSWORD.")
+        smtp = smtplib.SMTP(self.server, self.port)
+        try:
+            smtp.starttls()
+            smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    def _connection(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.IDLE_CHECK_SECONDS:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    raise OSError("SMTP connection is not ready.")
+            except Exception:
+                self._drop()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def _drop(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+            self._smtp = None
+
+    def send_messages(self, messages):
+        import smtplib
+
+        with self._lock:
+            sent = []
+            refused = {}
+            for index, msg in enumerate(messages):
+                try:
+                    try:
+                        self._connection().send_message(msg)
+                    except (smtplib.SMTPServerDisconnected, ConnectionError):
+                        # One reconnect per message covers a pooled session the
+                        # server closed between batches.
+                        self._drop()
+                        self._connection().send_message(msg)
+                except smtplib.SMTPRecipientsRefused as exc:
+                    # A bad address only loses its own message; the session
+                    # is still usable for the rest of the batch.
+                    refused[index] = exc
+                    continue
+                except Exception as exc:
+                    if sent or refused:
+                        raise PartialSendError(sent, {**refused, index: exc}) from exc
+                    raise
+                finally:
+                    self._last_used = time.monotonic()
+                sent.append(index)
+            if refused:
+                raise PartialSendError(sent, refused)
+            return len(sent)
+
+    def close(self):
+        with self._lock:
+            self._drop()
+
+
+class FileTransport(MailTransport):
+    name = "file"
+
+    def __init__(self, directory=None):
+        self.directory = directory or Config.MAIL_FILE_DIR
+
+    def send_messages(self, messages):
+        os.makedirs(self.directory, exist_ok=True)
+        for index, msg in enumerate(messages):
+            filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.eml"
+            tmp_path = os.path.join(self.directory, f".{filename}.tmp")
+            try:
+                with open(tmp_path, "wb") as handle:
+                    handle.write(msg.as_bytes())
+                os.replace(tmp_path, os.path.join(self.directory, filename))
+            except OSError as exc:
+                if index:
+                    raise PartialSendError(list(range(index)), {index: exc}) from exc
+                raise
+        return len(messages)
+
+
+class NullTransport(MailTransport):
+    name = "null"
+
+    def __init__(self):
+        self.count = 0
+
+    def send_messages(self, messages):
+        self.count += len(messages)
+        return len(messages)
+
+
+class MemoryTransport(MailTransport):
+    name = "memory"
+
+    def __init__(self):
+        self.outbox = []
+
+    def send_messages(self, messages):
+        self.outbox.extend(messages)
+        return len(messages)
+
+
+TRANSPORTS = {
+    transport.name: transport
+    for transport in (SMTPTransport, FileTransport, NullTransport, MemoryTransport)
+}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_transport(name=None):
+    name = (name or Config.MAIL_TRANSPORT or "smtp").strip().lower()
+    if name not in TRANSPORTS:
+        raise ValueError(f"Unknown mail transport: {name}")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = TRANSPORTS[name]()
+        return _instances[name]
+
+
+def close_transports():
+    with _instances_lock:
+        instances = list(_instances.values())
+    for transport in instances:
+        transport.close()
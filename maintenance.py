@@ -0,0 +1,147 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from config import Config
+from db import compact_history, get_connection, init_db
+
+
+def backup(dest_dir=None, keep=None, pages=None, sleep=None, out=sys.stdout):
+    """Copy the live database with SQLite's online backup API.
+
+    The copy runs in steps of ``pages`` pages and pauses ``sleep`` seconds
+    between them, so the app and scheduler can read and write meanwhile.
+    """
+    dest_dir = dest_dir or Config.BACKUP_DIR
+    keep = Config.BACKUP_KEEP if keep is None else keep
+    pages = pages or Config.BACKUP_PAGES_PER_STEP
+    sleep = Config.BACKUP_STEP_SLEEP if sleep is None else sleep
+
+    os.makedirs(dest_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(Config.DATABASE_PATH))[0]
+    dest_path = os.path.join(dest_dir, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.db")
+    tmp_path = f"{dest_path}.tmp"
+    started = time.perf_counter()
+
+    source = sqlite3.connect(Config.DATABASE_PATH)
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.backup(target, pages=pages, progress=lambda status, remaining, total: time.sleep(sleep))
+        if target.execute("PRAGMA quick_check;").fetchone()[0] != "ok":
+            raise RuntimeError(f"Backup {tmp_path} failed its integrity check.")
+    except Exception:
+        target.close()
+        os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.replace(tmp_path, dest_path)
+
+    prune_backups(dest_dir, name, keep)
+    size_mb = os.path.getsize(dest_path) / (1024 * 1024)
+    print(f"Backed up to {dest_path} ({size_mb:.1f} MB) in {time.perf_counter() - started:.2f}s.", file=out)
+    return dest_path
+
+
+def prune_backups(dest_dir, name, keep):
+    backups = sorted(
+        entry for entry in os.listdir(dest_dir) if entry.startswith(f"{name}-") and entry.endswith(".db")
+    )
+    for entry in backups[: max(0, len(backups) - keep)]:
+        os.remove(os.path.join(dest_dir, entry))
+
+
+def incremental_vacuum(pages=None, sleep=None):
+    """Return free pages to the filesystem a batch at a time.
+
+    Returns the number of pages freed, or None when the database was not
+    created with incremental auto-vacuum (see ``convert_to_incremental_vacuum``).
+    """
+    pages = pages or Config.VACUUM_PAGES_PER_STEP
+    sleep = Config.BACKUP_STEP_SLEEP if sleep is None else sleep
+    conn = get_connection()
+    try:
+        if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+            return None
+        freed = 0
+        while True:
+            free = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+            if not free:
+                return freed
+            conn.execute(f"PRAGMA incremental_vacuum({min(free, pages)});").fetchall()
+            freed += min(free, pages)
+            time.sleep(sleep)
+    finally:
+        conn.close()
+
+
+def convert_to_incremental_vacuum():
+    # Switching auto_vacuum modes needs one full VACUUM, which locks the
+    # database for its duration; run it once during a quiet window.
+    conn = get_connection()
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        conn.execute("VACUUM;")
+    finally:
+        conn.close()
+
+
+def compact(days=None, convert_vacuum=False, out=sys.stdout):
+    days = Config.HISTORY_RETENTION_DAYS if days is None else days
+    before_date = (date.today() - timedelta(days=days)).isoformat()
+    started = time.perf_counter()
+    compacted = compact_history(before_date)
+    print(f"Rolled {compacted} history row(s) before {before_date} into monthly summaries.", file=out)
+
+    if convert_vacuum:
+        convert_to_incremental_vacuum()
+        print("Converted the database to incremental auto-vacuum.", file=out)
+    freed = incremental_vacuum()
+    if freed is None:
+        print("Incremental vacuum is off; rerun with --convert-vacuum to enable it.", file=out)
+    else:
+        print(f"Freed {freed} page(s) in {time.perf_counter() - started:.2f}s.", file=out)
+    return compacted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Back up and compact the DailyLit database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup_parser = commands.add_parser("backup", help="Online backup of the database.")
+    backup_parser.add_argument("--dest", help=f"Backup directory (default: {Config.BACKUP_DIR}).")
+    backup_parser.add_argument(
+        "--keep",
+        type=int,
+        default=Config.BACKUP_KEEP,
+        help="Backups to keep (default: %(default)s).",
+    )
+
+    compact_parser = commands.add_parser("compact", help="Summarize old history and vacuum.")
+    compact_parser.add_argument(
+        "--days",
+        type=int,
+        default=Config.HISTORY_RETENTION_DAYS,
+        help="Keep daily history for this many days (default: %(default)s).",
+    )
+    compact_parser.add_argument(
+        "--convert-vacuum",
+        action="store_true",
+        help="One-time full VACUUM enabling incremental vacuum on an older database.",
+    )
+    args = parser.parse_args(argv)
+
+    init_db()
+    if args.command == "backup":
+        backup(args.dest, keep=max(1, args.keep))
+    else:
+        compact(args.days, convert_vacuum=args.convert_vacuum)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
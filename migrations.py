@@ -3,7 +3,7 @@ import sqlite3
 from config import Config
 
 
-CURRENT_SCHEMA_VERSION = 1
+CURRENT_SCHEMA_VERSION = 14
 
 
 def get_connection():
@@ -25,6 +25,14 @@ def get_schema_version(conn):
     return row["version"] if row and row["version"] is not None else 0
 
 
+def schema_is_current(conn):
+    try:
+        row = conn.execute("SELECT MAX(version) AS version FROM schema_migrations;").fetchone()
+    except sqlite3.OperationalError:
+        return False
+    return row["version"] == CURRENT_SCHEMA_VERSION
+
+
 def apply_migration(conn, version, sql):
     conn.executescript(sql)
     conn.execute("INSERT INTO schema_migrations (version) VALUES (?);", (version,))
@@ -33,6 +41,10 @@ def apply_migration(conn, version, sql):
 def migrate():
     conn = get_connection()
     try:
+        if conn.execute("SELECT COUNT(*) FROM sqlite_master;").fetchone()[0] == 0:
+            # Only takes effect before the first table exists; older databases
+            # are converted once by `maintenance.py compact --convert-vacuum`.
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
         version = get_schema_version(conn)
         if version < 1:
             apply_migration(
@@ -82,6 +94,229 @@ def migrate():
                 """,
             )
 
+        if version < 2:
+            apply_migration(
+                conn,
+                2,
+                """
+                CREATE TABLE IF NOT EXISTS book_index (
+                    book_id INTEGER PRIMARY KEY,
+                    page_words BLOB NOT NULL,
+                    page_sources BLOB NOT NULL,
+                    source_words BLOB NOT NULL,
+                    FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
+                );
+                """,
+            )
+
+        if version < 3:
+            apply_migration(
+                conn,
+                3,
+                """
+                CREATE TABLE IF NOT EXISTS book_leases (
+                    book_id INTEGER PRIMARY KEY,
+                    worker_id TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
+                );
+                """,
+            )
+
+        if version < 4:
+            apply_migration(
+                conn,
+                4,
+                """
+                CREATE TABLE IF NOT EXISTS delivery_journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    book_id INTEGER NOT NULL,
+                    sent_date DATE NOT NULL,
+                    state TEXT NOT NULL CHECK (state IN ('planned', 'rendered', 'sent', 'committed')),
+                    start_page INTEGER NOT NULL,
+                    end_page INTEGER NOT NULL,
+                    word_start INTEGER,
+                    word_end INTEGER,
+                    recipient TEXT,
+                    subject TEXT,
+                    plain_body TEXT,
+                    html_body TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
+                );
+                CREATE INDEX IF NOT EXISTS idx_journal_book_state ON delivery_journal(book_id, state);
+                """,
+            )
+
+        if version < 5:
+            apply_migration(
+                conn,
+                5,
+                """
+                CREATE TABLE IF NOT EXISTS cache_versions (
+                    scope TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                );
+                INSERT OR IGNORE INTO cache_versions (scope, version) VALUES ('settings', 0);
+                INSERT OR IGNORE INTO cache_versions (scope, version) VALUES ('books', 0);
+                """,
+            )
+
+        if version < 6:
+            apply_migration(
+                conn,
+                6,
+                """
+                ALTER TABLE delivery_journal ADD COLUMN kind TEXT NOT NULL DEFAULT 'book';
+                """,
+            )
+
+        if version < 7:
+            # The library lists books newest first, and the open-delivery lookup
+            # orders by id, which a (book_id) index yields without a sort.
+            apply_migration(
+                conn,
+                7,
+                """
+                CREATE INDEX IF NOT EXISTS idx_books_upload_date ON books(upload_date);
+                DROP INDEX IF EXISTS idx_journal_book_state;
+                CREATE INDEX IF NOT EXISTS idx_journal_book ON delivery_journal(book_id);
+                """,
+            )
+
+        if version < 8:
+            apply_migration(
+                conn,
+                8,
+                """
+                CREATE TABLE IF NOT EXISTS history_summaries (
+                    book_id INTEGER NOT NULL,
+                    month TEXT NOT NULL,
+                    deliveries INTEGER NOT NULL,
+                    pages INTEGER NOT NULL,
+                    words INTEGER NOT NULL,
+                    first_sent_date DATE NOT NULL,
+                    last_sent_date DATE NOT NULL,
+                    PRIMARY KEY (book_id, month),
+                    FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
+                );
+                """,
+            )
+
+        if version < 9:
+            apply_migration(
+                conn,
+                9,
+                """
+                ALTER TABLE books ADD COLUMN next_due_date DATE;
+                UPDATE books
+                SET next_due_date = COALESCE(
+                    (
+                        SELECT date(reading_progress.last_sent_date, '+1 day')
+                        FROM reading_progress
+                        WHERE reading_progress.book_id = books.id
+                    ),
+                    date('now', 'localtime')
+                );
+                CREATE INDEX IF NOT EXISTS idx_books_due ON books(status, next_due_date);
+                """,
+            )
+
+        if version < 10:
+            apply_migration(
+                conn,
+                10,
+                """
+                ALTER TABLE books ADD COLUMN memory_estimate INTEGER;
+                ALTER TABLE books ADD COLUMN peak_memory INTEGER;
+                """,
+            )
+
+        if version < 11:
+            apply_migration(
+                conn,
+                11,
+                """
+                CREATE TABLE IF NOT EXISTS book_units (
+                    book_id INTEGER NOT NULL,
+                    unit INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    PRIMARY KEY (book_id, unit),
+                    FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
+                );
+                """,
+            )
+
+        if version < 12:
+            # Existing settings stay as instance-wide defaults; the configured
+            # address becomes the first reader and owns every existing book.
+            apply_migration(
+                conn,
+                12,
+                """
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email TEXT NOT NULL UNIQUE,
+                    name TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                CREATE TABLE IF NOT EXISTS user_settings (
+                    user_id INTEGER NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT,
+                    PRIMARY KEY (user_id, key),
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                );
+                INSERT INTO users (email)
+                SELECT value FROM settings WHERE key = 'email_address' AND value != '';
+                ALTER TABLE books ADD COLUMN user_id INTEGER REFERENCES users(id) ON DELETE CASCADE;
+                UPDATE books SET user_id = (SELECT MIN(id) FROM users);
+                DROP INDEX IF EXISTS idx_books_upload_date;
+                CREATE INDEX IF NOT EXISTS idx_books_user_upload ON books(user_id, upload_date);
+                """,
+            )
+
+        if version < 13:
+            apply_migration(
+                conn,
+                13,
+                """
+                ALTER TABLE book_index ADD COLUMN page_offsets BLOB;
+                """,
+            )
+
+        if version < 14:
+            apply_migration(
+                conn,
+                14,
+                """
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    book_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'active',
+                    current_page INTEGER NOT NULL DEFAULT 0,
+                    current_word_position INTEGER NOT NULL DEFAULT 0,
+                    pages_per_day INTEGER NOT NULL DEFAULT 1,
+                    last_sent_date DATE,
+                    next_due_date DATE,
+                    completed_date DATE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (book_id, user_id),
+                    FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE,
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                );
+                CREATE INDEX IF NOT EXISTS idx_subscriptions_due ON subscriptions(status, next_due_date);
+                CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON subscriptions(user_id);
+                CREATE TABLE IF NOT EXISTS subscription_leases (
+                    subscription_id INTEGER PRIMARY KEY,
+                    worker_id TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    FOREIGN KEY (subscription_id) REFERENCES subscriptions(id) ON DELETE CASCADE
+                );
+                """,
+            )
+
         if version < CURRENT_SCHEMA_VERSION:
             conn.commit()
     finally:
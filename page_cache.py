@@ -0,0 +1,68 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import SizedLRUCache
+from config import Config
+from scheduler import load_pages, log_message, resolve_book_path
+
+
+def _page_size(page):
+    return sys.getsizeof(page[0]) + 64
+
+
+_pages = SizedLRUCache(max_bytes=Config.PAGE_CACHE_BYTES, sizeof=_page_size)
+_prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-prefetch")
+_prefetching = set()
+_prefetching_lock = threading.Lock()
+
+
+def _key(book, page):
+    return (Config.DATABASE_PATH, book["id"], book["file_path"], page)
+
+
+def _load_into_cache(book, first_page, last_page):
+    selection = load_pages(book, resolve_book_path(book), first_page, last_page)
+    for offset, page in enumerate(selection):
+        _pages.set(_key(book, first_page + offset), page)
+    return selection
+
+
+def _prefetch(book, first_page, last_page):
+    try:
+        _load_into_cache(book, first_page, last_page)
+    except Exception as exc:
+        log_message(f"Book {book['id']} prefetch of pages {first_page}-{last_page} failed: {exc}")
+    finally:
+        with _prefetching_lock:
+            _prefetching.discard(_key(book, first_page))
+
+
+def schedule_prefetch(book, after_page, count=None):
+    count = Config.PAGE_PREFETCH if count is None else count
+    first_page = after_page + 1
+    last_page = min(after_page + count, book["total_pages"])
+    while first_page <= last_page and _key(book, first_page) in _pages:
+        first_page += 1
+    if first_page > last_page:
+        return None
+
+    key = _key(book, first_page)
+    with _prefetching_lock:
+        if key in _prefetching:
+            return None
+        _prefetching.add(key)
+    return _prefetcher.submit(_prefetch, dict(book), first_page, last_page)
+
+
+def get_pages(book, first_page, last_page, prefetch=True):
+    pages = [_pages.get(_key(book, page)) for page in range(first_page, last_page + 1)]
+    missing = [first_page + offset for offset, page in enumerate(pages) if page is None]
+    if missing:
+        loaded = _load_into_cache(book, missing[0], missing[-1])
+        for offset, page in enumerate(loaded):
+            pages[missing[0] - first_page + offset] = page
+
+    if prefetch:
+        schedule_prefetch(book, last_page)
+    return [page for page in pages if page is not None]
@@ -0,0 +1,237 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import Config
+from db import get_settings
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.path.join(BASE_DIR, "logs", "profiles")
+TARGETS = ("run", "book", "requests")
+
+_PROFILE_NAME_RE = re.compile(r"^[\w.-]+$")
+_active_lock = threading.Lock()
+_active_session = None
+_tracking_lock = threading.Lock()
+_tracking_count = 0
+_tracking_started = False
+
+
+def enabled_targets():
+    raw = os.getenv("DAILYLIT_PROFILE", "")
+    try:
+        raw = f"{raw},{get_settings().get('profile_targets', '')}"
+    except Exception:
+        pass
+    return {target.strip().lower() for target in raw.split(",") if target.strip().lower() in TARGETS}
+
+
+def should_profile(target):
+    if target not in enabled_targets():
+        return False
+    if target == "requests":
+        return random.random() < Config.PROFILE_REQUEST_SAMPLE_RATE
+    return True
+
+
+def _safe_label(label):
+    return re.sub(r"[^\w.-]+", "-", label).strip("-") or "profile"
+
+
+class Session:
+    def __init__(self, label):
+        self.label = _safe_label(label)
+        self.profiler = cProfile.Profile()
+        self.started_tracing = False
+        self.started_at = None
+        self.noted_peak = 0
+
+    def start(self):
+        # cProfile and tracemalloc are process-wide, so only one session may
+        # run at a time; an outer run profile already covers inner books.
+        global _active_session
+        with _active_lock:
+            if _active_session is not None:
+                return False
+            _active_session = self
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(Config.PROFILE_TRACEMALLOC_FRAMES)
+            self.started_tracing = True
+        tracemalloc.reset_peak()
+        self.started_at = time.perf_counter()
+        self.profiler.enable()
+        return True
+
+    def stop(self):
+        global _active_session
+        self.profiler.disable()
+        duration = time.perf_counter() - self.started_at
+        peak = max(tracemalloc.get_traced_memory()[1], self.noted_peak)
+        snapshot = tracemalloc.take_snapshot()
+        if self.started_tracing:
+            tracemalloc.stop()
+        with _active_lock:
+            _active_session = None
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{self.label}"
+        base_path = os.path.join(PROFILE_DIR, name)
+        self.profiler.dump_stats(f"{base_path}.pstats")
+        snapshot.dump(f"{base_path}.tracemalloc")
+        with open(f"{base_path}.json", "w", encoding="utf-8") as handle:
+            json.dump(
+                {
+                    "name": name,
+                    "label": self.label,
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "duration_seconds": round(duration, 4),
+                    "peak_memory_bytes": peak,
+                },
+                handle,
+            )
+        prune_profiles()
+        return name
+
+
+@contextmanager
+def profiled(target, label):
+    session = Session(label) if _active_session is None and should_profile(target) else None
+    if session is None or not session.start():
+        yield None
+        return
+    try:
+        yield session
+    finally:
+        session.stop()
+
+
+class PeakMemory:
+    peak = 0
+
+
+@contextmanager
+def track_peak_memory():
+    """Measure the tracemalloc high-water mark of the enclosed block.
+
+    tracemalloc is process-wide, so blocks running at the same time in other
+    threads share (and reset) one high-water mark.
+    """
+    global _tracking_count, _tracking_started
+    tracker = PeakMemory()
+    with _tracking_lock:
+        if _tracking_count == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+            _tracking_started = True
+        _tracking_count += 1
+    session = _active_session
+    if session is not None:
+        # Keep the enclosing profile's peak before resetting it for this block.
+        session.noted_peak = max(session.noted_peak, tracemalloc.get_traced_memory()[1])
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    try:
+        yield tracker
+    finally:
+        tracker.peak = max(0, tracemalloc.get_traced_memory()[1] - baseline)
+        with _tracking_lock:
+            _tracking_count -= 1
+            if _tracking_count == 0 and _tracking_started:
+                tracemalloc.stop()
+                _tracking_started = False
+
+
+def _profile_names():
+    try:
+        files = os.listdir(PROFILE_DIR)
+    except OSError:
+        return []
+    return sorted((name[: -len(".json")] for name in files if name.endswith(".json")), reverse=True)
+
+
+def prune_profiles(keep=None):
+    keep = Config.PROFILE_KEEP if keep is None else keep
+    for name in _profile_names()[keep:]:
+        for extension in (".json", ".pstats", ".tracemalloc"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name + extension))
+            except OSError:
+                pass
+
+
+def profile_path(name, extension):
+    if not _PROFILE_NAME_RE.match(name or "") or extension not in {".pstats", ".tracemalloc"}:
+        return None
+    path = os.path.join(PROFILE_DIR, name + extension)
+    return path if os.path.exists(path) else None
+
+
+def top_functions(name, limit=10):
+    path = profile_path(name, ".pstats")
+    if not path:
+        return []
+    stats = pstats.Stats(path)
+    rows = []
+    for (filename, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append(
+            {
+                "function": f"{os.path.basename(filename)}:{line}({function})",
+                "calls": calls,
+                "total_seconds": total,
+                "cumulative_seconds": cumulative,
+            }
+        )
+    rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+    return rows[:limit]
+
+
+def top_allocations(name, limit=5):
+    path = profile_path(name, ".tracemalloc")
+    if not path:
+        return []
+    snapshot = tracemalloc.Snapshot.load(path)
+    return [
+        {"location": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+def list_profiles(limit=20):
+    profiles = []
+    for name in _profile_names()[:limit]:
+        try:
+            with open(os.path.join(PROFILE_DIR, f"{name}.json"), "r", encoding="utf-8") as handle:
+                summary = json.load(handle)
+        except (OSError, ValueError):
+            continue
+        summary["functions"] = top_functions(name)
+        summary["allocations"] = top_allocations(name)
+        profiles.append(summary)
+    return profiles
+
+
+def init_app(app):
+    from flask import g, request
+
+    @app.before_request
+    def start_request_profile():
+        if request.endpoint in {"static", "admin_profiles", "admin_profile_download"}:
+            return
+        if _active_session is None and should_profile("requests"):
+            session = Session(f"request-{request.endpoint or 'unknown'}")
+            if session.start():
+                g.profile_session = session
+
+    @app.teardown_request
+    def stop_request_profile(exc):
+        session = g.pop("profile_session", None)
+        if session is not None:
+            session.stop()
@@ -1,25 +1,64 @@
 import os
+import socket
 import time as time_module
+import uuid
+from contextlib import contextmanager
 from datetime import date, datetime
-from email.message import EmailMessage
-import smtplib
-
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from markupsafe import Markup
+from functools import partial
 
 from config import Config
-from db import get_active_books, get_settings, insert_history, set_book_status, update_progress
-from text_processing import chunk_text_with_word_ranges, count_words, extract_text
+from db import (
+    advance_subscriptions,
+    claim_due_books,
+    claim_due_subscriptions,
+    commit_deliveries,
+    commit_delivery,
+    get_book_index,
+    get_book_units,
+    get_open_delivery,
+    get_user_settings,
+    mark_deliveries_sent,
+    mark_delivery_sent,
+    plan_delivery,
+    record_book_memory,
+    record_rendered_delivery,
+    release_book,
+    renew_book_lease,
+    save_book_index,
+    set_book_status,
+    update_progress,
+)
+from mail_transport import PartialSendError, build_message, close_transports, get_transport
+from profiling import profiled, track_peak_memory
+from text_processing import (
+    build_page_index,
+    build_page_index_streaming,
+    build_txt_page_offsets,
+    count_words,
+    estimate_memory,
+    extract_pages,
+    extract_units,
+    supports_page_ranges,
+)
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 LOG_PATH = os.path.join(BASE_DIR, "logs", "email_log.txt")
 DEBUG = os.getenv("DAILYLIT_DEBUG", "0").strip() == "1"
 
-_TEMPLATE_ENV = Environment(
-    loader=FileSystemLoader(os.path.join(BASE_DIR, "templates")),
-    autoescape=select_autoescape(["html"]),
-)
+_template_env = None
+
+
+def get_template_env():
+    global _template_env
+    if _template_env is None:
+        from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+        _template_env = Environment(
+            loader=FileSystemLoader(os.path.join(BASE_DIR, "templates")),
+            autoescape=select_autoescape(["html"]),
+        )
+    return _template_env
 
 
 def log_message(message):
@@ -29,12 +68,10 @@ def log_message(message):
         handle.write(f"[{timestamp}] {message}\n")
 
 
-def build_email(book, day, total_pages, content, start_page, end_page, percent):
-    subject = f"[DailyLit] {book['title']} - Day {day} of ~{total_pages}"
-    tomorrow_page = end_page + 1 if end_page < total_pages else end_page
-    reading_time_minutes = max(1, round(count_words(content) / 200))
+def _reading_context(book, total_pages, content, end_page, percent):
+    from markupsafe import Markup
 
-    context = {
+    return {
         "title": book["title"],
         "author": book["author"] or "Unknown",
         "total_pages": total_pages,
@@ -42,89 +79,274 @@ def build_email(book, day, total_pages, content, start_page, end_page, percent):
         "percent": percent,
         "content": content,
         "content_html": Markup(content.replace("\n", "<br />")),
-        "reading_time_minutes": reading_time_minutes,
-        "tomorrow_page": tomorrow_page,
+        "reading_time_minutes": max(1, round(count_words(content) / 200)),
+        "tomorrow_page": end_page + 1 if end_page < total_pages else end_page,
     }
 
-    plain = _TEMPLATE_ENV.get_template("email.txt").render(context)
-    html = _TEMPLATE_ENV.get_template("email.html").render(context)
+
+def build_email(book, day, total_pages, content, start_page, end_page, percent):
+    subject = f"[DailyLit] {book['title']} - Day {day} of ~{total_pages}"
+    context = _reading_context(book, total_pages, content, end_page, percent)
+
+    env = get_template_env()
+    plain = env.get_template("email.txt").render(context)
+    html = env.get_template("email.html").render(context)
     return subject, plain, html
 
 
-def send_email(subject, plain, html, recipient):
-    if not Config.EMAIL_PASSWORD:
-        raise RuntimeError("Missing GMAIL_APP_PASSWORD.")
+def build_digest(deliveries):
+    sections = []
+    for book, entry in deliveries:
+        percent = round((entry["end_page"] / book["total_pages"]) * 100)
+        section = _reading_context(
+            book, book["total_pages"], entry["plain_body"], entry["end_page"], percent
+        )
+        section["start_page"] = entry["start_page"]
+        sections.append(section)
+    count = len(sections)
+    subject = f"[DailyLit] Daily digest - {count} book{'s' if count != 1 else ''}"
+    context = {
+        "sections": sections,
+        "reading_time_minutes": sum(section["reading_time_minutes"] for section in sections),
+    }
+
+    env = get_template_env()
+    plain = env.get_template("digest.txt").render(context)
+    html = env.get_template("digest.html").render(context)
+    return subject, plain, html
 
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = Config.EMAIL_ADDRESS
-    msg["To"] = recipient
-    msg.set_content(plain)
-    msg.add_alternative(html, subtype="html")
 
+def send_email(subject, plain, html, recipient):
+    transport = get_transport()
     if DEBUG:
-        log_message(f"SMTP connect {Config.SMTP_SERVER}:{Config.SMTP_PORT} as {Config.EMAIL_ADDRESS}")
-    with smtplib.SMTP(Config.SMTP_SERVER, Config.SMTP_PORT) as smtp:
-        smtp.starttls()
-        if DEBUG:
-            log_message("SMTP STARTTLS ok")
-        smtp.login(Config.EMAIL_ADDRESS, Config.EMAIL_PASSWORD)
-        if DEBUG:
-            log_message(f"SMTP login ok, sending to {recipient}")
-        smtp.send_message(msg)
+        log_message(f"Sending via {transport.name} transport to {recipient}")
+    transport.send_message(build_message(subject, plain, html, recipient))
 
 
-def process_book(book, force=False):
-    settings = get_settings()
-    recipient = settings.get("email_address") or Config.EMAIL_ADDRESS
-    today = date.today().isoformat()
+def resolve_book_path(book):
     file_path = book["file_path"]
     if not os.path.isabs(file_path):
         file_path = os.path.join(BASE_DIR, file_path)
+    return file_path
+
+
+def uses_streaming(book, file_path):
+    estimate = book["memory_estimate"]
+    if estimate is None:
+        estimate = estimate_memory(file_path, book["file_type"])
+    return estimate > Config.BOOK_MEMORY_BUDGET
+
+
+def load_pages(book, file_path, start_page, end_page):
+    index = None
+    if supports_page_ranges(book["file_type"]):
+        index = get_book_index(book["id"])
+    if index and end_page <= len(index["page_words"]):
+        if book["file_type"] == "txt" and "page_offsets" not in index:
+            # TXT books indexed before byte offsets existed get them in one
+            # streaming pass; their pagination is unchanged.
+            index["page_offsets"] = build_txt_page_offsets(file_path, index["page_words"])
+            save_book_index(book["id"], index)
+        read_units = None
+        if book["file_type"] == "pdf":
+            read_units = partial(get_book_units, book["id"])
+        return extract_pages(file_path, book["file_type"], index, start_page, end_page, read_units)
+
+    # Books ingested before page indexes existed pay for one full parse here;
+    # later deliveries only touch the source pages they need. Their page
+    # counts came from raw PDF text, so the index keeps it unnormalized.
+    if uses_streaming(book, file_path):
+        index = build_page_index_streaming(file_path, book["file_type"], Config.WORDS_PER_PAGE, normalize=False)
+        _save_backfilled_index(book, file_path, index)
+        return extract_pages(file_path, book["file_type"], index, start_page, end_page)
+    units = extract_units(file_path, book["file_type"], normalize=False)
+    chunks, index = build_page_index(units, Config.WORDS_PER_PAGE)
+    _save_backfilled_index(book, file_path, index)
+    return chunks[start_page - 1 : end_page]
+
+
+def _save_backfilled_index(book, file_path, index):
+    if book["file_type"] == "txt":
+        index["page_offsets"] = build_txt_page_offsets(file_path, index["page_words"])
+    save_book_index(book["id"], index)
+
+
+@contextmanager
+def tracked_memory(book):
+    if not Config.TRACK_BOOK_MEMORY:
+        yield
+        return
+    with track_peak_memory() as tracker:
+        yield
+    record_book_memory(book["id"], tracker.peak)
+    if tracker.peak > Config.BOOK_MEMORY_BUDGET:
+        log_message(
+            f"Book {book['id']} peaked at {tracker.peak / 1048576:.1f} MB, over the "
+            f"{Config.BOOK_MEMORY_BUDGET / 1048576:.0f} MB budget; it will be streamed from now on."
+        )
+    elif DEBUG:
+        log_message(f"Book {book['id']} peaked at {tracker.peak / 1048576:.1f} MB.")
+
+
+def process_book(book, force=False):
+    with profiled("book", f"book-{book['id']}"), tracked_memory(book):
+        return _process_book(book, force)
+
+
+def _process_book(book, force=False):
+    ok, message, entry = prepare_delivery(book, force)
+    if entry is None:
+        return ok, message
+
+    if entry["state"] == "rendered":
+        success, last_error = _send_with_retries(
+            f"Book {book['id']}", entry["subject"], entry["plain_body"], entry["html_body"], entry["recipient"]
+        )
+        if not success:
+            log_message(f"Book {book['id']} email failed: {last_error}")
+            return False, "Email send failed."
+        entry = mark_delivery_sent(entry["id"])
+
+    commit_delivery(entry["id"])
+    log_message(f"Book {book['id']} sent pages {entry['start_page']}-{entry['end_page']}.")
+    return True, f"Sent pages {entry['start_page']}-{entry['end_page']}."
+
+
+def prepare_delivery(book, force=False, kind="book"):
+    """Plan and render a book's next delivery, resuming any journaled one.
+
+    Returns ``(ok, message, entry)``; ``entry`` is None when nothing is left to send.
+    """
+    today = date.today().isoformat()
     if DEBUG:
         log_message(
             f"Book {book['id']} status={book['status']} current_page={book['current_page']} "
-            f"pages_per_day={book['pages_per_day']} last_sent={book['last_sent_date']} recipient={recipient} "
-            f"cwd={os.getcwd()}"
+            f"pages_per_day={book['pages_per_day']} last_sent={book['last_sent_date']} cwd={os.getcwd()}"
         )
     if book["status"] != "active":
-        return False, "Book is not active."
+        return False, "Book is not active.", None
     if book["last_sent_date"] == today and not force:
         if DEBUG:
             log_message(f"Book {book['id']} skipped (already sent today).")
-        return False, "Already sent today."
+        return False, "Already sent today.", None
+
+    start_page = book["current_page"] + 1
+    if start_page > book["total_pages"]:
+        set_book_status(book["id"], "completed")
+        update_progress(book["id"], book["current_page"], book["current_word_position"], today, today)
+        log_message(f"Book {book['id']} marked completed (already finished).")
+        return True, "Book already completed.", None
+
+    days = 1 if force else days_due(book, today)
+    end_page = min(book["current_page"] + book["pages_per_day"] * days, book["total_pages"])
+    entry = get_open_delivery(book["id"])
+    if entry and (entry["start_page"] != start_page or entry["kind"] != kind):
+        log_message(f"Book {book['id']} discarding stale {entry['state']} delivery {entry['id']}.")
+        entry = None
+    if entry:
+        log_message(
+            f"Book {book['id']} resuming {entry['state']} delivery of pages "
+            f"{entry['start_page']}-{entry['end_page']}."
+        )
+    else:
+        entry = plan_delivery(book["id"], today, start_page, end_page, kind)
+
+    if entry["state"] == "planned":
+        recipient = get_user_settings(book["user_id"]).get("email_address") or Config.EMAIL_ADDRESS
+        ok, result = render_delivery(book, entry, resolve_book_path(book), recipient)
+        if not ok:
+            return False, result, None
+        entry = result
+    return True, "", entry
 
+
+def days_due(book, today):
+    """Days of pages owed: one, plus missed runs up to SCHEDULER_CATCH_UP_DAYS."""
+    if not book["next_due_date"]:
+        return 1
+    missed = (date.fromisoformat(today) - date.fromisoformat(book["next_due_date"])).days
+    return max(1, min(missed + 1, Config.SCHEDULER_CATCH_UP_DAYS))
+
+
+def _send_with_retries(label, subject, plain, html, recipient):
+    last_error = None
+    for _ in range(3):
+        try:
+            send_email(subject, plain, html, recipient)
+            return True, None
+        except Exception as exc:
+            last_error = exc
+            if DEBUG:
+                log_message(f"{label} send attempt failed: {exc}")
+            time_module.sleep(300)
+    return False, last_error
+
+
+def send_digests(deliveries, worker_id=None):
+    """Send one digest per recipient and commit its books in one transaction.
+
+    With ``worker_id``, each book's lease is renewed just before its digest
+    goes out and books whose lease was lost are left to the new holder.
+    Returns the books whose progress was committed.
+    """
+    by_recipient = {}
+    for book, entry in deliveries:
+        by_recipient.setdefault(entry["recipient"], []).append((book, entry))
+
+    delivered = []
+    for recipient, group in by_recipient.items():
+        if worker_id:
+            group = [(book, entry) for book, entry in group if _renew_lease(book["id"], worker_id)]
+            if not group:
+                continue
+        # Entries already marked sent went out in an interrupted run's digest.
+        unsent = [(book, entry) for book, entry in group if entry["state"] == "rendered"]
+        if unsent:
+            subject, plain, html = build_digest(unsent)
+            success, last_error = _send_with_retries(f"Digest to {recipient}", subject, plain, html, recipient)
+            if not success:
+                log_message(f"Digest to {recipient} failed: {last_error}")
+                continue
+            mark_deliveries_sent([entry["id"] for _, entry in unsent])
+        commit_deliveries([entry["id"] for _, entry in group])
+        log_message(f"Digest to {recipient} covered {len(group)} book(s).")
+        delivered.extend(book for book, _ in group)
+    return delivered
+
+
+def render_delivery(book, entry, file_path, recipient):
+    ok, result = render_pages(book, file_path, entry["start_page"], entry["end_page"], entry["kind"])
+    if not ok:
+        return False, result
+    subject, plain, html, word_start, word_end = result
+    return True, record_rendered_delivery(
+        entry["id"], recipient, word_start, word_end, subject, plain, html
+    )
+
+
+def render_pages(book, file_path, start_page, end_page, kind="book"):
+    """Load and render one page range of a book.
+
+    Returns ``(True, (subject, plain, html, word_start, word_end))`` or
+    ``(False, message)``.
+    """
     try:
         if not os.path.exists(file_path):
             log_message(f"Book {book['id']} missing file: {file_path}")
             return False, "Book file not found."
         if DEBUG:
             log_message(f"Book {book['id']} loading {file_path}")
-        text = extract_text(file_path, book["file_type"])
-        chunks = chunk_text_with_word_ranges(text, Config.WORDS_PER_PAGE)
+        selection = load_pages(book, file_path, start_page, end_page)
     except Exception as exc:
         log_message(f"Book {book['id']} failed to load: {exc}")
         if DEBUG:
             return False, f"Failed to read book content: {exc}"
         return False, "Failed to read book content."
 
-    if not chunks:
+    if not selection:
         log_message(f"Book {book['id']} has no content.")
         return False, "No content to send."
 
-    start_page = book["current_page"] + 1
-    if start_page > book["total_pages"]:
-        set_book_status(book["id"], "completed")
-        update_progress(book["id"], book["current_page"], book["current_word_position"], today, today)
-        log_message(f"Book {book['id']} marked completed (already finished).")
-        return True, "Book already completed."
-
-    end_page = min(book["current_page"] + book["pages_per_day"], book["total_pages"])
-    selection = chunks[book["current_page"] : end_page]
-    if not selection:
-        log_message(f"Book {book['id']} has no chunk selection.")
-        return False, "Unable to select next chunk."
-
     content = "\n\n".join(chunk for chunk, _, _ in selection)
     word_start = selection[0][1]
     word_end = selection[-1][2]
@@ -134,48 +356,170 @@ def process_book(book, force=False):
             f"Book {book['id']} sending pages {start_page}-{end_page} "
             f"words {word_start}-{word_end} ({percent}%)"
         )
-    subject, plain, html = build_email(
-        book,
-        day=end_page,
-        total_pages=book["total_pages"],
-        content=content,
-        start_page=start_page,
-        end_page=end_page,
-        percent=percent,
-    )
+    if kind == "digest":
+        # Digest sections are rendered together at send time; keep the raw pages.
+        subject, plain, html = book["title"], content, None
+    else:
+        subject, plain, html = build_email(
+            book,
+            day=end_page,
+            total_pages=book["total_pages"],
+            content=content,
+            start_page=start_page,
+            end_page=end_page,
+            percent=percent,
+        )
+    return True, (subject, plain, html, word_start, word_end)
 
-    success = False
-    last_error = None
-    for _ in range(3):
+
+def _subscription_book(subscription):
+    return {
+        "id": subscription["book_id"],
+        "title": subscription["title"],
+        "author": subscription["author"],
+        "file_path": subscription["file_path"],
+        "file_type": subscription["file_type"],
+        "total_pages": subscription["total_pages"],
+        "memory_estimate": subscription["memory_estimate"],
+        "peak_memory": subscription["peak_memory"],
+    }
+
+
+def fan_out(subject, plain, html, subscriptions):
+    """Send one rendered delivery to every subscriber, a batch per SMTP session.
+
+    Returns the subscriptions whose message was sent. Refused addresses and
+    the rest of a batch cut short by an error are logged and retried on a
+    later run; the messages that did go out are still counted.
+    """
+    transport = get_transport()
+    delivered = []
+    for first in range(0, len(subscriptions), Config.SUBSCRIPTION_SEND_BATCH):
+        batch = subscriptions[first : first + Config.SUBSCRIPTION_SEND_BATCH]
         try:
-            send_email(subject, plain, html, recipient)
-            success = True
-            break
+            transport.send_messages(
+                [build_message(subject, plain, html, subscription["email"]) for subscription in batch]
+            )
+        except PartialSendError as exc:
+            for index, error in exc.failed.items():
+                log_message(f"Book {batch[index]['book_id']} subscriber {batch[index]['email']} failed: {error}")
+            delivered.extend(batch[index] for index in exc.sent)
+            continue
         except Exception as exc:
-            last_error = exc
-            if DEBUG:
-                log_message(f"Book {book['id']} send attempt failed: {exc}")
-            time_module.sleep(300)
+            log_message(f"Book {batch[0]['book_id']} subscriber batch of {len(batch)} failed: {exc}")
+            continue
+        delivered.extend(batch)
+    return delivered
 
-    if not success:
-        log_message(f"Book {book['id']} email failed: {last_error}")
-        return False, "Email send failed."
 
-    completed_date = today if end_page >= book["total_pages"] else None
-    update_progress(book["id"], end_page, word_end, today, completed_date)
-    insert_history(book["id"], today, start_page, end_page, word_start, word_end)
-    if completed_date:
-        set_book_status(book["id"], "completed")
-    log_message(f"Book {book['id']} sent pages {start_page}-{end_page}.")
-    return True, f"Sent pages {start_page}-{end_page}."
+def process_subscriptions(worker_id, today=None):
+    """Deliver due subscriptions, loading and rendering each page range once.
+
+    Subscribers due the same pages of the same book share one render. Failed
+    sends keep their lease until it expires, like failed books.
+    """
+    today = today or date.today().isoformat()
+    attempted = set()
+    rendered = {}
+    sent = 0
+    while True:
+        claimed = claim_due_subscriptions(worker_id, today, limit=Config.SCHEDULER_BATCH_SIZE)
+        batch = [subscription for subscription in claimed if subscription["id"] not in attempted]
+        if not batch:
+            break
+
+        groups = {}
+        finished = []
+        for subscription in batch:
+            attempted.add(subscription["id"])
+            start_page = subscription["current_page"] + 1
+            if start_page > subscription["total_pages"]:
+                finished.append(
+                    (subscription["id"], subscription["current_page"], subscription["current_word_position"], today, today)
+                )
+                continue
+            days = days_due(subscription, today)
+            end_page = min(
+                subscription["current_page"] + subscription["pages_per_day"] * days,
+                subscription["total_pages"],
+            )
+            groups.setdefault((subscription["book_id"], start_page, end_page), []).append(subscription)
+
+        delivered = finished
+        for (book_id, start_page, end_page), subscriptions in groups.items():
+            key = (book_id, start_page, end_page)
+            if key not in rendered:
+                book = _subscription_book(subscriptions[0])
+                with profiled("book", f"book-{book_id}"), tracked_memory(book):
+                    ok, result = render_pages(book, resolve_book_path(book), start_page, end_page)
+                rendered[key] = result if ok else None
+            if rendered[key] is None:
+                continue
+            subject, plain, html, _, word_end = rendered[key]
+            completed = today if end_page >= subscriptions[0]["total_pages"] else None
+            sent_to = fan_out(subject, plain, html, subscriptions)
+            delivered.extend((subscription["id"], end_page, word_end, today, completed) for subscription in sent_to)
+            sent += len(sent_to)
+            log_message(f"Book {book_id} pages {start_page}-{end_page} sent to {len(sent_to)} subscriber(s).")
+        if delivered:
+            advance_subscriptions(worker_id, delivered)
+    return sent
+
+
+def _renew_lease(book_id, worker_id):
+    book = renew_book_lease(book_id, worker_id)
+    if book is None:
+        log_message(f"Book {book_id} lease was taken over by another worker; skipping it.")
+    return book
 
 
-def process_books():
-    books = get_active_books()
+def make_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def process_books(worker_id=None):
+    with profiled("run", "process_books"):
+        _process_books(worker_id)
+
+
+def _process_books(worker_id=None):
+    worker_id = worker_id or make_worker_id()
+    today = date.today().isoformat()
+    attempted = set()
+    pending = []
+    if DEBUG:
+        log_message(f"Worker {worker_id} processing due books.")
+    while True:
+        batch = claim_due_books(worker_id, today, limit=Config.SCHEDULER_BATCH_SIZE, exclude=attempted)
+        if not batch:
+            break
+        for claimed in batch:
+            attempted.add(claimed["id"])
+            # The whole batch was leased at claim time and earlier books may
+            # have spent it on retries, so renew before touching this one and
+            # plan from its current progress, not the claimed row.
+            book = _renew_lease(claimed["id"], worker_id)
+            if book is None:
+                continue
+            if get_user_settings(book["user_id"]).get("delivery_mode") == "digest":
+                with profiled("book", f"book-{book['id']}"), tracked_memory(book):
+                    ok, _, entry = prepare_delivery(book, kind="digest")
+                if entry is not None:
+                    pending.append((book, entry))
+                    continue
+            else:
+                ok, _ = process_book(book)
+            # Failed books keep their lease until it expires so other workers
+            # don't retry them straight away in the same run.
+            if ok:
+                release_book(book["id"], worker_id)
+    if pending:
+        for book in send_digests(pending, worker_id):
+            release_book(book["id"], worker_id)
+    process_subscriptions(worker_id, today)
+    close_transports()
     if DEBUG:
-        log_message(f"Processing {len(books)} active book(s).")
-    for book in books:
-        process_book(book)
+        log_message(f"Worker {worker_id} processed {len(attempted)} book(s).")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+(function () {
+  "use strict";
+
+  var form = document.getElementById("upload-form");
+  if (!form || !window.fetch || !window.localStorage || !Blob.prototype.slice) {
+    return;
+  }
+  var status = document.getElementById("upload-status");
+  var MAX_RETRIES = 5;
+
+  function show(message) {
+    status.textContent = message;
+    status.hidden = false;
+  }
+
+  function json(response) {
+    return response.json().then(function (body) {
+      if (!response.ok && response.status !== 409) {
+        throw new Error(body.error || "Upload failed.");
+      }
+      return body;
+    });
+  }
+
+  function storageKey(file) {
+    return "dailylit-upload:" + file.name + ":" + file.size + ":" + file.lastModified;
+  }
+
+  function start(file) {
+    var saved = localStorage.getItem(storageKey(file));
+    var resume = saved
+      ? fetch("/upload/chunked/" + saved).then(function (response) {
+          return response.ok ? response.json() : null;
+        })
+      : Promise.resolve(null);
+    return resume.then(function (state) {
+      if (state) {
+        return state;
+      }
+      return fetch("/upload/chunked", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          filename: file.name,
+          size: file.size,
+          title: form.elements.title.value,
+          author: form.elements.author.value,
+          pages_per_day: form.elements.pages_per_day.value,
+        }),
+      })
+        .then(json)
+        .then(function (state) {
+          localStorage.setItem(storageKey(file), state.upload_id);
+          return state;
+        });
+    });
+  }
+
+  function sendFrom(file, state, retries) {
+    if (state.received >= file.size) {
+      return Promise.resolve(state);
+    }
+    show("Uploading… " + Math.floor((state.received / file.size) * 100) + "%");
+    var end = Math.min(state.received + state.chunk_size, file.size);
+    return fetch("/upload/chunked/" + state.upload_id, {
+      method: "PUT",
+      headers: { "Upload-Offset": String(state.received) },
+      body: file.slice(state.received, end),
+    })
+      .then(json)
+      .then(function (next) {
+        return sendFrom(file, next, MAX_RETRIES);
+      })
+      .catch(function (error) {
+        if (!retries) {
+          throw error;
+        }
+        return new Promise(function (resolve) {
+          setTimeout(resolve, 1000 * (MAX_RETRIES - retries + 1));
+        })
+          .then(function () {
+            return fetch("/upload/chunked/" + state.upload_id).then(json);
+          })
+          .then(function (current) {
+            return sendFrom(file, current, retries - 1);
+          });
+      });
+  }
+
+  form.addEventListener("submit", function (event) {
+    var file = form.elements.book_file.files[0];
+    if (!file) {
+      return;
+    }
+    event.preventDefault();
+    start(file)
+      .then(function (state) {
+        return sendFrom(file, state, MAX_RETRIES);
+      })
+      .then(function (state) {
+        show("Checking file…");
+        return fetch("/upload/chunked/" + state.upload_id + "/preview")
+          .then(json)
+          .catch(function (error) {
+            localStorage.removeItem(storageKey(file));
+            throw error;
+          });
+      })
+      .then(function (state) {
+        show(
+          state.estimated_pages
+            ? "Processing about " + state.estimated_pages + " pages…"
+            : "Processing…"
+        );
+        return fetch("/upload/chunked/" + state.upload_id + "/complete", {
+          method: "POST",
+        }).then(json);
+      })
+      .then(function (details) {
+        localStorage.removeItem(storageKey(file));
+        show(
+          "Upload complete: " + details.title + " (" + details.total_words +
+            " words, " + details.total_pages + " pages)."
+        );
+        form.reset();
+      })
+      .catch(function (error) {
+        show(error.message);
+      });
+  });
+})();
@@ -0,0 +1,61 @@
+import sqlite3
+
+import db
+from config import Config
+
+
+def test_settings_reads_are_cached_until_a_write(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        db.init_db()
+        db.get_settings()
+
+        opened = []
+        original_connect = db.get_connection
+
+        def counting_connection():
+            opened.append(True)
+            return original_connect()
+
+        monkeypatch.setattr(db, "get_connection", counting_connection)
+        assert db.get_settings()["timezone"] == "local"
+        assert opened == []
+
+        db.set_setting("timezone", "UTC")
+        opened.clear()
+        assert db.get_settings()["timezone"] == "UTC"
+        assert len(opened) == 1
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_writes_from_another_process_invalidate_via_version_row(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        db.init_db()
+        book_id = db.insert_book(
+            title="Cached",
+            author=None,
+            filename="cached.txt",
+            file_path="cached.txt",
+            file_type="txt",
+            total_words=10,
+            total_pages=1,
+        )
+        db.insert_progress(book_id, pages_per_day=1)
+        assert db.get_book_detail(book_id)["status"] == "active"
+
+        # Simulate the scheduler process writing through its own connection.
+        conn = sqlite3.connect(Config.DATABASE_PATH)
+        conn.execute("UPDATE books SET status = 'paused' WHERE id = ?;", (book_id,))
+        conn.execute("UPDATE cache_versions SET version = version + 1 WHERE scope = 'books';")
+        conn.commit()
+        conn.close()
+
+        assert db.get_book_detail(book_id)["status"] == "active"
+        monkeypatch.setattr(Config, "CACHE_VERSION_CHECK_SECONDS", 0)
+        assert db.get_book_detail(book_id)["status"] == "paused"
+    finally:
+        Config.DATABASE_PATH = original_db
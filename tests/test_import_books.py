@@ -0,0 +1,53 @@
+import io
+
+from config import Config
+from db import get_book_detail, get_book_index, get_books_with_progress, init_db
+from import_books import import_entries, read_manifest
+
+
+def test_import_manifest_in_parallel_batches(tmp_path):
+    original_db = Config.DATABASE_PATH
+    original_upload = Config.UPLOAD_FOLDER
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        Config.UPLOAD_FOLDER = str(tmp_path / "uploads")
+        init_db()
+
+        library = tmp_path / "library"
+        library.mkdir()
+        for number in range(3):
+            (library / f"book{number}.txt").write_text(
+                f"Book number {number} starts here. It has a second sentence.",
+                encoding="utf-8",
+            )
+        (library / "broken.pdf").write_bytes(b"not a pdf")
+        (library / "manifest.csv").write_text(
+            "path,title,author,pages_per_day\n"
+            "book0.txt,Zero,Ann,2\n"
+            "book1.txt,,,\n"
+            "book2.txt,Two,,\n"
+            "broken.pdf,Broken,,\n",
+            encoding="utf-8",
+        )
+
+        out = io.StringIO()
+        imported, failures = import_entries(
+            read_manifest(str(library / "manifest.csv")),
+            workers=2,
+            batch_size=2,
+            out=out,
+        )
+
+        assert imported == 3
+        assert [path for path, _ in failures] == [str(library / "broken.pdf")]
+        assert "FAIL" in out.getvalue()
+
+        books = {row["title"]: row for row in get_books_with_progress()}
+        assert set(books) == {"Zero", "book1", "Two"}
+        assert books["Zero"]["pages_per_day"] == 2
+        detail = get_book_detail(books["book1"]["id"])
+        assert detail["file_path"].startswith(Config.UPLOAD_FOLDER)
+        assert get_book_index(books["Two"]["id"]) is not None
+    finally:
+        Config.DATABASE_PATH = original_db
+        Config.UPLOAD_FOLDER = original_upload
@@ -2,10 +2,15 @@ import math
 import os
 import tempfile
 
+import pytest
+
 import scheduler
+from app import create_app
 from config import Config
 from db import (
+    commit_delivery,
     get_book_detail,
+    get_open_delivery,
     get_reading_history,
     get_active_books,
     init_db,
@@ -67,3 +72,87 @@ def test_upload_send_updates_progress():
     finally:
         Config.DATABASE_PATH = original_db
         Config.UPLOAD_FOLDER = original_upload
+
+
+def test_interrupted_delivery_resumes_without_rework(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        file_path = tmp_path / "resume.txt"
+        file_path.write_text("First page sentence. Second page sentence.", encoding="utf-8")
+        book_id = insert_book(
+            title="Resume",
+            author="Author",
+            filename="resume.txt",
+            file_path=str(file_path),
+            file_type="txt",
+            total_words=6,
+            total_pages=2,
+        )
+        insert_progress(book_id, pages_per_day=1)
+        monkeypatch.setattr(scheduler.time_module, "sleep", lambda seconds: None)
+
+        def failing_send(*args, **kwargs):
+            raise OSError("network down")
+
+        monkeypatch.setattr(scheduler, "send_email", failing_send)
+        ok, _ = scheduler.process_book(get_active_books()[0])
+        assert not ok
+        assert get_open_delivery(book_id)["state"] == "rendered"
+
+        sent = []
+
+        def fail_load(*args, **kwargs):
+            raise AssertionError("rendered deliveries must not be re-extracted")
+
+        def crash_commit(journal_id):
+            raise RuntimeError("scheduler killed")
+
+        monkeypatch.setattr(scheduler, "load_pages", fail_load)
+        monkeypatch.setattr(scheduler, "send_email", lambda *args: sent.append(args))
+        monkeypatch.setattr(scheduler, "commit_delivery", crash_commit)
+        with pytest.raises(RuntimeError):
+            scheduler.process_book(get_active_books()[0])
+        assert len(sent) == 1
+        assert get_open_delivery(book_id)["state"] == "sent"
+
+        monkeypatch.setattr(scheduler, "commit_delivery", commit_delivery)
+        ok, _ = scheduler.process_book(get_active_books()[0])
+        assert ok
+        assert len(sent) == 1
+        assert get_open_delivery(book_id) is None
+        assert get_book_detail(book_id)["current_page"] == 1
+        assert len(get_reading_history(book_id)) == 1
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_readers_only_see_their_own_books(tmp_path):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        client = create_app().test_client()
+        book_id = insert_book(
+            title="First Reader Book",
+            author="Author",
+            filename="first.txt",
+            file_path="first.txt",
+            file_type="txt",
+            total_words=10,
+            total_pages=1,
+        )
+        insert_progress(book_id, pages_per_day=1)
+        assert b"First Reader Book" in client.get("/").get_data()
+
+        client.post("/settings/reader", data={"reader_email": "second@example.com"})
+        assert b"First Reader Book" not in client.get("/").get_data()
+        assert client.post(f"/book/{book_id}/reset").status_code == 404
+        client.post("/settings/delivery", data={"delivery_mode": "digest"})
+        assert b"second@example.com" in client.get("/settings").get_data()
+
+        client.post("/settings/reader", data={"reader_email": Config.EMAIL_ADDRESS})
+        assert b"First Reader Book" in client.get("/").get_data()
+        assert b"One email per book" in client.get("/settings").get_data()
+    finally:
+        Config.DATABASE_PATH = original_db
@@ -0,0 +1,109 @@
+import smtplib
+from email import message_from_bytes
+
+import pytest
+
+import scheduler
+from config import Config
+from db import get_active_books, get_book_detail, init_db, insert_book, insert_progress
+from mail_transport import (
+    FileTransport,
+    NullTransport,
+    PartialSendError,
+    SMTPTransport,
+    build_message,
+    get_transport,
+)
+
+
+def test_file_and_null_transports_accept_batches(tmp_path):
+    messages = [
+        build_message(f"Subject {number}", "Plain body.", "<p>Html body.</p>", "reader@example.com")
+        for number in range(3)
+    ]
+
+    outbox = tmp_path / "outbox"
+    assert FileTransport(str(outbox)).send_messages(messages) == 3
+    files = sorted(outbox.glob("*.eml"))
+    assert len(files) == 3
+    parsed = message_from_bytes(files[0].read_bytes())
+    assert parsed["To"] == "reader@example.com"
+
+    null = NullTransport()
+    null.send_messages(messages)
+    null.send_message(messages[0])
+    assert null.count == 4
+
+
+class FakeSMTP:
+    def __init__(self, refuse=(), fail_on=None):
+        self.refuse = set(refuse)
+        self.fail_on = fail_on
+        self.delivered = []
+
+    def send_message(self, msg):
+        if msg["To"] in self.refuse:
+            raise smtplib.SMTPRecipientsRefused({msg["To"]: (550, b"No such user")})
+        if msg["To"] == self.fail_on:
+            raise smtplib.SMTPDataError(451, b"Try again later")
+        self.delivered.append(msg["To"])
+
+    def noop(self):
+        return (250, b"OK")
+
+    def quit(self):
+        pass
+
+
+def test_smtp_batch_reports_which_messages_went_out():
+    messages = [
+        build_message("Subject", "Plain body.", "<p>Html body.</p>", f"reader{number}@example.com")
+        for number in range(5)
+    ]
+    transport = SMTPTransport(password="secret")
+    smtp = FakeSMTP(refuse={"reader1@example.com"}, fail_on="reader3@example.com")
+    transport._connect = lambda: smtp
+
+    with pytest.raises(PartialSendError) as raised:
+        transport.send_messages(messages)
+
+    # The refused address is skipped; the hard failure stops the batch.
+    assert raised.value.sent == [0, 2]
+    assert sorted(raised.value.failed) == [1, 3]
+    assert smtp.delivered == ["reader0@example.com", "reader2@example.com"]
+
+    smtp.fail_on = None
+    smtp.refuse.clear()
+    assert transport.send_messages(messages[3:]) == 2
+
+
+def test_process_book_sends_through_configured_transport(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        monkeypatch.setattr(Config, "MAIL_TRANSPORT", "memory")
+        monkeypatch.setattr(Config, "EMAIL_PASSWORD", None)
+        init_db()
+        file_path = tmp_path / "offline.txt"
+        file_path.write_text("Offline delivery works without credentials.", encoding="utf-8")
+        book_id = insert_book(
+            title="Offline",
+            author=None,
+            filename="offline.txt",
+            file_path=str(file_path),
+            file_type="txt",
+            total_words=5,
+            total_pages=1,
+        )
+        insert_progress(book_id, pages_per_day=1)
+
+        transport = get_transport()
+        transport.outbox.clear()
+        ok, _ = scheduler.process_book(get_active_books()[0])
+
+        assert ok
+        assert len(transport.outbox) == 1
+        assert "Offline" in transport.outbox[0]["Subject"]
+        assert get_book_detail(book_id)["status"] == "completed"
+    finally:
+        Config.DATABASE_PATH = original_db
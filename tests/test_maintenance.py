@@ -0,0 +1,79 @@
+import io
+import os
+import sqlite3
+from datetime import date, timedelta
+
+import maintenance
+from config import Config
+from db import get_history_summaries, get_reading_history, init_db, insert_book, insert_history, insert_progress
+
+
+def _seed_history(tmp_path, days):
+    book_id = insert_book(
+        title="Sample",
+        author="Author",
+        filename="sample.txt",
+        file_path=str(tmp_path / "sample.txt"),
+        file_type="txt",
+        total_words=4000,
+        total_pages=400,
+    )
+    insert_progress(book_id, pages_per_day=1)
+    today = date.today()
+    for offset in range(days):
+        sent_date = (today - timedelta(days=offset)).isoformat()
+        insert_history(book_id, sent_date, offset + 1, offset + 1, offset * 10, offset * 10 + 9)
+    return book_id
+
+
+def test_compact_rolls_old_history_into_monthly_summaries(tmp_path):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        book_id = _seed_history(tmp_path, 120)
+
+        out = io.StringIO()
+        compacted = maintenance.compact(days=30, out=out)
+        assert compacted == 89
+        assert len(get_reading_history(book_id, limit=500)) == 31
+
+        summaries = get_history_summaries(book_id)
+        assert sum(row["deliveries"] for row in summaries) == 89
+        # Word ranges are inclusive: each delivery covers ten words.
+        assert sum(row["words"] for row in summaries) == 89 * 10
+        assert len(summaries) == len({row["month"] for row in summaries})
+        assert "Freed" in out.getvalue()
+
+        # A second pass over an already summarized month adds to it.
+        assert maintenance.compact(days=-1, out=out) == 31
+        summaries = get_history_summaries(book_id)
+        assert sum(row["deliveries"] for row in summaries) == 120
+        assert sum(row["words"] for row in summaries) == 120 * 10
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_backup_copies_the_live_database_in_steps(tmp_path):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        _seed_history(tmp_path, 50)
+        dest_dir = tmp_path / "backups"
+
+        paths = [
+            maintenance.backup(str(dest_dir), keep=2, pages=1, sleep=0, out=io.StringIO())
+            for _ in range(3)
+        ]
+        assert sorted(entry.name for entry in dest_dir.iterdir()) == sorted(
+            os.path.basename(path) for path in paths[-2:]
+        )
+
+        conn = sqlite3.connect(paths[-1])
+        try:
+            assert conn.execute("SELECT COUNT(*) FROM reading_history;").fetchone()[0] == 50
+        finally:
+            conn.close()
+    finally:
+        Config.DATABASE_PATH = original_db
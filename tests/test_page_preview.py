@@ -0,0 +1,58 @@
+import io
+
+import page_cache
+from app import create_app
+from cache import SizedLRUCache
+from config import Config
+from db import get_book_detail
+
+
+def test_page_route_serves_pages_and_prefetches_ahead(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    original_upload = Config.UPLOAD_FOLDER
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        Config.UPLOAD_FOLDER = str(tmp_path / "uploads")
+        client = create_app().test_client()
+        text = " ".join(f"Sentence number {n} is here." for n in range(400))
+        client.post(
+            "/upload",
+            data={"book_file": (io.BytesIO(text.encode("utf-8")), "long.txt"), "title": "Long"},
+            content_type="multipart/form-data",
+        )
+        book = get_book_detail(1)
+        assert book["total_pages"] >= 4
+
+        response = client.get("/book/1/page/2")
+        assert response.status_code == 200
+        assert b"Page 2 of" in response.data
+
+        # The prefetcher is a single worker, so a no-op queued behind it
+        # finishing means the read-ahead for pages 3-5 is done.
+        page_cache._prefetcher.submit(lambda: None).result()
+
+        def fail_load(*args, **kwargs):
+            raise AssertionError("prefetched pages must come from the cache")
+
+        monkeypatch.setattr(page_cache, "load_pages", fail_load)
+        monkeypatch.setattr(page_cache, "schedule_prefetch", lambda *args, **kwargs: None)
+        response = client.get("/book/1/page/3?count=2")
+        assert b"Pages 3-4 of" in response.data
+
+        assert client.get(f"/book/1/page/{book['total_pages'] + 1}").status_code == 302
+    finally:
+        Config.DATABASE_PATH = original_db
+        Config.UPLOAD_FOLDER = original_upload
+
+
+def test_sized_cache_evicts_least_recent_to_stay_under_budget():
+    cache = SizedLRUCache(max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    cache.get("a")
+    cache.set("c", "xxxx")
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert cache.current_bytes == 8
+    cache.set("huge", "x" * 11)
+    assert "huge" not in cache
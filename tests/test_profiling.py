@@ -0,0 +1,54 @@
+import os
+
+import profiling
+import scheduler
+from app import create_app
+from config import Config
+from db import get_active_books, init_db, insert_book, insert_progress
+
+
+def test_book_profile_is_recorded_and_listed(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    original_transport = Config.MAIL_TRANSPORT
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        Config.MAIL_TRANSPORT = "memory"
+        monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+        monkeypatch.setenv("DAILYLIT_PROFILE", "book")
+        init_db()
+
+        file_path = tmp_path / "sample.txt"
+        file_path.write_text("Hello world. This is a test sentence.", encoding="utf-8")
+        book_id = insert_book(
+            title="Sample",
+            author="Author",
+            filename="sample.txt",
+            file_path=str(file_path),
+            file_type="txt",
+            total_words=7,
+            total_pages=1,
+        )
+        insert_progress(book_id, pages_per_day=1)
+
+        ok, _ = scheduler.process_book(get_active_books()[0], force=True)
+        assert ok
+
+        files = os.listdir(profiling.PROFILE_DIR)
+        assert any(name.endswith(".pstats") for name in files)
+        assert any(name.endswith(".tracemalloc") for name in files)
+
+        profiles = profiling.list_profiles()
+        assert len(profiles) == 1
+        assert profiles[0]["label"] == f"book-{book_id}"
+        assert any("_process_book" in row["function"] for row in profiles[0]["functions"])
+
+        client = create_app().test_client()
+        response = client.get("/admin/profiles")
+        assert response.status_code == 200
+        assert f"book-{book_id}".encode() in response.data
+        download = client.get(f"/admin/profiles/{profiles[0]['name']}/pstats")
+        assert download.status_code == 200
+        assert client.get("/admin/profiles/..%2Fsecret/pstats").status_code == 404
+    finally:
+        Config.DATABASE_PATH = original_db
+        Config.MAIL_TRANSPORT = original_transport
@@ -0,0 +1,238 @@
+import inspect
+import re
+import sqlite3
+from array import array
+from datetime import date, timedelta
+
+import db
+from config import Config
+
+
+BOOKS = 2000
+USERS = 200
+HISTORY_PER_BOOK = 20
+# Whole-table reads that are intentional: settings is loaded in one go, and
+# json_each walks an id list bound as a parameter rather than a table.
+FULL_SCAN_TABLES = {"settings", "json_each"}
+# Public db helpers that never build their own query.
+NOT_QUERIES = {"get_connection", "init_db"}
+# Offline maintenance jobs that read whole tables on purpose.
+BATCH_JOBS = {"compact_history"}
+
+_STATEMENT_RE = re.compile(r"^\s*(SELECT|UPDATE|DELETE|WITH|INSERT\b.*\bSELECT\b)", re.IGNORECASE | re.DOTALL)
+_SCAN_RE = re.compile(r"^SCAN (\w+)\b(?! USING)")
+
+
+def _seed(tmp_path):
+    Config.DATABASE_PATH = str(tmp_path / "plans.db")
+    db.init_db()
+    conn = db.get_connection()
+    start = date(2024, 1, 1)
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (email) VALUES (?);",
+            [(f"reader{number}@example.com",) for number in range(2, USERS + 1)],
+        )
+        conn.executemany(
+            """
+            INSERT INTO books (
+                id, user_id, title, author, filename, file_path, file_type, total_words, total_pages, upload_date,
+                status, next_due_date
+            )
+            VALUES (?, ?, ?, 'Author', 'book.txt', 'book.txt', 'txt', 9000, 30, ?, ?, ?);
+            """,
+            [
+                (
+                    book_id,
+                    book_id % USERS + 1,
+                    f"Book {book_id}",
+                    f"2024-01-01 00:{book_id % 60:02d}:00",
+                    ("active", "paused", "completed")[book_id % 3],
+                    (start + timedelta(days=book_id % 30)).isoformat(),
+                )
+                for book_id in range(1, BOOKS + 1)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO reading_progress (book_id, current_page, pages_per_day, last_sent_date) VALUES (?, 3, 1, ?);",
+            [(book_id, start.isoformat()) for book_id in range(1, BOOKS + 1)],
+        )
+        conn.executemany(
+            """
+            INSERT INTO reading_history (book_id, sent_date, start_page, end_page, word_start, word_end)
+            VALUES (?, ?, 1, 1, 0, 300);
+            """,
+            [
+                (book_id, (start + timedelta(days=day)).isoformat())
+                for book_id in range(1, BOOKS + 1)
+                for day in range(HISTORY_PER_BOOK)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO subscriptions (book_id, user_id, pages_per_day, next_due_date) VALUES (?, ?, 1, ?);",
+            [
+                (book_id, (book_id + offset) % USERS + 1, (start + timedelta(days=book_id % 30)).isoformat())
+                for book_id in range(1, BOOKS + 1)
+                for offset in (1, 2)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO delivery_journal (book_id, sent_date, state, start_page, end_page) VALUES (?, ?, 'committed', 1, 1);",
+            [(book_id, start.isoformat()) for book_id in range(1, BOOKS + 1)],
+        )
+    conn.close()
+
+
+def _exercise_db(tmp_path, statements, exempt):
+    """Call every public query helper in db.py once, returning the names called."""
+    called = set()
+
+    def call(name, *args, **kwargs):
+        called.add(name)
+        first = len(statements)
+        result = getattr(db, name)(*args, **kwargs)
+        if name in BATCH_JOBS:
+            exempt.update(statements[first:])
+        return result
+
+    today = date.today().isoformat()
+    index = {key: array("I", [1, 2, 3]) for key in ("page_words", "page_sources", "source_words")}
+    user_id = call("create_user", "new@example.com", "New Reader")
+    call("default_user_id")
+    call("get_user", user_id)
+    call("get_user_by_email", "reader5@example.com")
+    call("set_user_email", user_id, "renamed@example.com")
+    call("set_user_setting", user_id, "delivery_mode", "digest")
+    call("get_user_settings", user_id)
+    book_id = call(
+        "insert_book",
+        title="New",
+        author="Author",
+        filename="new.txt",
+        file_path=str(tmp_path / "new.txt"),
+        file_type="txt",
+        total_words=10,
+        total_pages=3,
+        user_id=user_id,
+    )
+    call("insert_progress", book_id, 1)
+    call("get_books_with_progress", 7)
+    call("get_book_detail", book_id, user_id)
+    call("get_reading_history", 5)
+    call("get_history_summaries", 5)
+    call("set_book_status", book_id, "active")
+    call("update_pages_per_day", book_id, 2)
+    call("record_book_memory", book_id, 1024)
+    call("get_active_books")
+    call("claim_due_books", "worker", today, limit=5, exclude={1, 2})
+    call("renew_book_lease", book_id, "worker")
+    call("release_book", book_id, "worker")
+    subscription_id = call("add_subscription", book_id, 5, 2)
+    call("get_subscriptions", book_id)
+    call("claim_due_subscriptions", "worker", today, limit=5)
+    call("advance_subscriptions", "worker", [(subscription_id, 2, 20, today, None)])
+    call("delete_subscription", subscription_id, book_id)
+    call("save_book_index", book_id, index)
+    call("get_book_index", book_id)
+    call("save_book_units", book_id, ["First page.", "Second page."])
+    call(
+        "insert_books",
+        [
+            {
+                "user_id": None,
+                "title": "Imported",
+                "author": None,
+                "filename": "imported.pdf",
+                "file_path": str(tmp_path / "imported.pdf"),
+                "file_type": "pdf",
+                "total_words": 10,
+                "total_pages": 3,
+                "pages_per_day": 1,
+                "index": index,
+                "units": ["First page.", "Second page."],
+            }
+        ],
+    )
+    call("get_book_units", book_id, 0, 1)
+    entry = call("plan_delivery", book_id, today, 1, 2)
+    call("get_open_delivery", book_id)
+    call("get_delivery", entry["id"])
+    call("record_rendered_delivery", entry["id"], "reader@example.com", 0, 10, "Subject", "Plain", None)
+    call("mark_delivery_sent", entry["id"])
+    call("mark_deliveries_sent", [entry["id"]])
+    call("commit_delivery", entry["id"])
+    entry = call("plan_delivery", book_id, today, 3, 3)
+    db.record_rendered_delivery(entry["id"], "reader@example.com", 10, 20, "Subject", "Plain", None)
+    call("commit_deliveries", [entry["id"]])
+    call("update_progress", book_id, 1, 10, today)
+    call("insert_history", book_id, today, 1, 1, 0, 10)
+    call("mark_book_completed", book_id)
+    call("reset_progress", book_id)
+    call("get_cache_version", "books")
+    call("set_setting", "email_address", "reader@example.com")
+    call("get_settings")
+    call("compact_history", "2024-01-10")
+    call("delete_book", book_id)
+    return called
+
+
+def _problems(conn, sql):
+    problems = []
+    for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"):
+        detail = row["detail"]
+        scan = _SCAN_RE.match(detail)
+        if "USE TEMP B-TREE" in detail or (scan and scan.group(1) not in FULL_SCAN_TABLES):
+            problems.append(detail)
+    return problems
+
+
+def suggest_index(sql, detail):
+    """Rough hint for a failing plan: the filtered or ordered columns of the table."""
+    scan = _SCAN_RE.match(detail)
+    if scan:
+        table = scan.group(1)
+        columns = re.findall(rf"\b{table}\.(\w+)\s*(?:=|<|>|IN\b)", sql)
+        columns += re.findall(r"\bWHERE\s+(\w+)\s*(?:=|<|>|IN\b)", sql) if f"FROM {table}" in sql else []
+    else:
+        order_by = re.search(r"ORDER BY (.+?)(?:LIMIT|;|$)", sql, re.DOTALL)
+        table = re.search(r"FROM (\w+)", sql).group(1)
+        columns = [part.split()[0].split(".")[-1] for part in order_by.group(1).split(",")] if order_by else []
+    unique = list(dict.fromkeys(columns))
+    return f"CREATE INDEX ... ON {table}({', '.join(unique) or '?'});"
+
+
+def test_every_db_query_uses_an_index(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    statements = []
+    exempt = set()
+    original_connection = db.get_connection
+
+    def traced_connection():
+        conn = original_connection()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    try:
+        _seed(tmp_path)
+        monkeypatch.setattr(db, "get_connection", traced_connection)
+        called = _exercise_db(tmp_path, statements, exempt)
+
+        public = {
+            name
+            for name, value in inspect.getmembers(db, inspect.isfunction)
+            if value.__module__ == "db" and not name.startswith("_")
+        }
+        assert public - NOT_QUERIES <= called, "add new db.py helpers to _exercise_db"
+
+        conn = sqlite3.connect(Config.DATABASE_PATH)
+        conn.row_factory = sqlite3.Row
+        failures = []
+        for sql in dict.fromkeys(statements):
+            if sql in exempt or not _STATEMENT_RE.match(sql):
+                continue
+            for detail in _problems(conn, sql):
+                failures.append(f"{detail}\n  {' '.join(sql.split())}\n  hint: {suggest_index(sql, detail)}")
+        conn.close()
+        assert not failures, "\n".join(failures)
+    finally:
+        Config.DATABASE_PATH = original_db
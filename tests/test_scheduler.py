@@ -1,3 +1,25 @@
+import threading
+from datetime import date, timedelta
+
+import scheduler
+from config import Config
+from db import (
+    add_subscription,
+    claim_due_books,
+    create_user,
+    get_book_detail,
+    get_connection,
+    get_reading_history,
+    get_subscriptions,
+    init_db,
+    insert_book,
+    insert_progress,
+    release_book,
+    renew_book_lease,
+    set_setting,
+    set_user_setting,
+)
+from mail_transport import PartialSendError, get_transport
 from scheduler import build_email
 
 
@@ -17,3 +39,372 @@ def test_build_email_subject_and_body():
     assert "Page 3 of 10 (30%)" in plain
     assert "Hello world." in plain
     assert "Hello world." in html
+
+
+def _seed_books(tmp_path, count, user_id=None, prefix="book"):
+    book_ids = []
+    for number in range(count):
+        file_path = tmp_path / f"{prefix}{number}.txt"
+        file_path.write_text(f"Book {number} has one short page.", encoding="utf-8")
+        book_id = insert_book(
+            title=f"Book {number}",
+            author="Author",
+            filename=file_path.name,
+            file_path=str(file_path),
+            file_type="txt",
+            total_words=7,
+            total_pages=1,
+            user_id=user_id,
+        )
+        insert_progress(book_id, pages_per_day=1)
+        book_ids.append(book_id)
+    return book_ids
+
+
+def test_claims_are_exclusive_until_the_lease_expires(tmp_path):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        _seed_books(tmp_path, 3)
+        today = date.today().isoformat()
+
+        first = claim_due_books("worker-a", today, limit=2)
+        second = claim_due_books("worker-b", today, limit=10)
+        assert len(first) == 2
+        assert [row["id"] for row in second] == [3]
+
+        assert claim_due_books("worker-c", today) == []
+        release_book(first[0]["id"], "worker-a")
+        reclaimed = claim_due_books("worker-c", today, lease_seconds=-1)
+        assert [row["id"] for row in reclaimed] == [first[0]["id"]]
+        # worker-c's lease has already lapsed, so the book is up for grabs again.
+        assert [row["id"] for row in claim_due_books("worker-d", today)] == [first[0]["id"]]
+        assert renew_book_lease(first[0]["id"], "worker-c") is None
+        assert renew_book_lease(first[0]["id"], "worker-d")["id"] == first[0]["id"]
+
+        release_book(first[1]["id"], "worker-a")
+        assert claim_due_books("worker-e", today, exclude={first[1]["id"]}) == []
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def _expire_lease(book_id):
+    conn = get_connection()
+    try:
+        conn.execute("UPDATE book_leases SET expires_at = 0 WHERE book_id = ?;", (book_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_books_whose_lease_lapsed_mid_batch_are_not_sent_twice(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        # Digest books come first, so worker-a has them rendered and waiting
+        # in its digest queue when it stalls.
+        digest_reader = create_user("digest@example.com", "Digest")
+        set_user_setting(digest_reader, "delivery_mode", "digest")
+        digest_ids = _seed_books(tmp_path, 2, user_id=digest_reader, prefix="digest")
+        book_ids = _seed_books(tmp_path, 3)
+
+        sent = []
+
+        def slow_send_email(subject, plain, html, recipient):
+            sent.append(subject)
+            if len(sent) == 1:
+                # worker-a stalls on its first single-book send long enough for
+                # the rest of its batch, digest books included, to lapse.
+                for book_id in book_ids[1:] + digest_ids:
+                    _expire_lease(book_id)
+                scheduler.process_books("worker-b")
+
+        monkeypatch.setattr(scheduler, "send_email", slow_send_email)
+        scheduler.process_books("worker-a")
+
+        assert len(sent) == len(set(sent)) == len(book_ids) + 1
+        for book_id in book_ids + digest_ids:
+            assert len(get_reading_history(book_id)) == 1
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_attempted_books_do_not_stop_the_claim_loop(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        book_ids = _seed_books(tmp_path, 4)
+        monkeypatch.setattr(Config, "SCHEDULER_BATCH_SIZE", 2)
+        monkeypatch.setattr(Config, "SCHEDULER_LEASE_SECONDS", -1)
+        monkeypatch.setattr(scheduler.time_module, "sleep", lambda seconds: None)
+
+        def send_email(subject, plain, html, recipient):
+            if "Book 0" in subject or "Book 1" in subject:
+                raise OSError("mailbox full")
+            sent.append(subject)
+
+        sent = []
+        monkeypatch.setattr(scheduler, "send_email", send_email)
+        scheduler.process_books("worker-a")
+
+        # The first two fail and their leases lapse at once; they must not be
+        # re-claimed as a full batch that hides the two books still due.
+        assert len(sent) == 2
+        assert [get_book_detail(book_id)["current_page"] for book_id in book_ids] == [0, 0, 1, 1]
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_concurrent_workers_never_send_a_book_twice(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        book_ids = _seed_books(tmp_path, 12)
+        monkeypatch.setattr(Config, "SCHEDULER_BATCH_SIZE", 2)
+
+        sent = []
+        lock = threading.Lock()
+
+        def fake_send_email(subject, plain, html, recipient):
+            with lock:
+                sent.append(subject)
+
+        monkeypatch.setattr(scheduler, "send_email", fake_send_email)
+        workers = [
+            threading.Thread(target=scheduler.process_books, args=(f"worker-{n}",))
+            for n in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        assert len(sent) == len(set(sent)) == len(book_ids)
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_digest_mode_sends_one_email_and_commits_every_book(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        book_ids = _seed_books(tmp_path, 4)
+        set_setting("delivery_mode", "digest")
+        monkeypatch.setattr(Config, "SCHEDULER_BATCH_SIZE", 3)
+
+        sent = []
+        monkeypatch.setattr(
+            scheduler, "send_email", lambda subject, plain, html, recipient: sent.append((subject, plain, html))
+        )
+        scheduler.process_books("worker-a")
+
+        assert len(sent) == 1
+        subject, plain, html = sent[0]
+        assert "4 books" in subject
+        for number, book_id in enumerate(book_ids):
+            assert f"Book {number} has one short page." in plain
+            assert f"Book {number}" in html
+            detail = get_book_detail(book_id)
+            assert detail["current_page"] == 1
+            assert detail["status"] == "completed"
+            assert len(get_reading_history(book_id)) == 1
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_each_reader_gets_their_own_delivery_mode_and_address(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        _seed_books(tmp_path, 2)
+        reader = create_user("second@example.com", "Second")
+        set_user_setting(reader, "delivery_mode", "digest")
+        _seed_books(tmp_path, 3, user_id=reader, prefix="second")
+
+        sent = []
+        monkeypatch.setattr(
+            scheduler, "send_email", lambda subject, plain, html, recipient: sent.append((subject, recipient))
+        )
+        scheduler.process_books("worker-a")
+
+        recipients = [recipient for _, recipient in sent]
+        assert recipients.count("second@example.com") == 1
+        assert recipients.count(Config.EMAIL_ADDRESS) == 2
+        assert any("3 books" in subject for subject, recipient in sent if recipient == "second@example.com")
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_subscribers_due_the_same_pages_share_one_render(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        monkeypatch.setattr(Config, "WORDS_PER_PAGE", 5)
+        monkeypatch.setattr(Config, "MAIL_TRANSPORT", "memory")
+        monkeypatch.setattr(Config, "SUBSCRIPTION_SEND_BATCH", 2)
+        file_path = tmp_path / "shared.txt"
+        file_path.write_text("One two three four five. Six seven eight nine ten. Eleven twelve thirteen fourteen fifteen.")
+        book_id = insert_book(
+            title="Shared",
+            author="Author",
+            filename=file_path.name,
+            file_path=str(file_path),
+            file_type="txt",
+            total_words=15,
+            total_pages=3,
+        )
+        insert_progress(book_id, pages_per_day=1)
+        for number, pages in enumerate((1, 1, 1, 2)):
+            add_subscription(book_id, create_user(f"sub{number}@example.com"), pages)
+
+        loads = []
+        original_load_pages = scheduler.load_pages
+
+        def counting_load_pages(book, file_path, start_page, end_page):
+            loads.append((start_page, end_page))
+            return original_load_pages(book, file_path, start_page, end_page)
+
+        monkeypatch.setattr(scheduler, "load_pages", counting_load_pages)
+        outbox = get_transport("memory").outbox
+        outbox.clear()
+        scheduler.process_books("worker-a")
+
+        assert sorted(msg["To"] for msg in outbox) == sorted(
+            [Config.EMAIL_ADDRESS] + [f"sub{number}@example.com" for number in range(4)]
+        )
+        # The owner's delivery and the two subscriber ranges: pages 1-1 and 1-2.
+        assert sorted(loads) == [(1, 1), (1, 1), (1, 2)]
+        progress = {row["email"]: row["current_page"] for row in get_subscriptions(book_id)}
+        assert progress == {"sub0@example.com": 1, "sub1@example.com": 1, "sub2@example.com": 1, "sub3@example.com": 2}
+
+        outbox.clear()
+        scheduler.process_books("worker-b")
+        assert outbox == []
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_fan_out_advances_subscribers_sent_before_a_failure(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        monkeypatch.setattr(Config, "WORDS_PER_PAGE", 5)
+        monkeypatch.setattr(Config, "MAIL_TRANSPORT", "memory")
+        monkeypatch.setattr(Config, "SUBSCRIPTION_SEND_BATCH", 3)
+        file_path = tmp_path / "shared.txt"
+        file_path.write_text("One two three four five. Six seven eight nine ten.")
+        book_id = insert_book(
+            title="Shared",
+            author="Author",
+            filename=file_path.name,
+            file_path=str(file_path),
+            file_type="txt",
+            total_words=10,
+            total_pages=2,
+        )
+        for number in range(6):
+            add_subscription(book_id, create_user(f"sub{number}@example.com"), 1)
+
+        class FlakyTransport:
+            """Sends until the Nth message of a batch, then drops the session."""
+
+            def __init__(self, fail_at):
+                self.fail_at = fail_at
+                self.outbox = []
+
+            def send_messages(self, messages):
+                for index, msg in enumerate(messages):
+                    if index == self.fail_at:
+                        raise PartialSendError(list(range(index)), {index: OSError("connection reset")})
+                    self.outbox.append(msg["To"])
+                return len(messages)
+
+        # Leases lapse at once so the retry below does not wait them out.
+        monkeypatch.setattr(Config, "SCHEDULER_LEASE_SECONDS", -1)
+        transport = FlakyTransport(fail_at=1)
+        monkeypatch.setattr(scheduler, "get_transport", lambda: transport)
+        scheduler.process_subscriptions("worker-a")
+
+        # Each batch of three loses its second message; later batches still go.
+        assert sorted(transport.outbox) == ["sub0@example.com", "sub3@example.com"]
+        progress = {row["email"]: row["current_page"] for row in get_subscriptions(book_id)}
+        assert progress["sub0@example.com"] == progress["sub3@example.com"] == 1
+        assert all(progress[f"sub{number}@example.com"] == 0 for number in (1, 2, 4, 5))
+
+        # Once the failed leases lapse, the next run resends only to the missed.
+        transport.fail_at = None
+        transport.outbox.clear()
+        scheduler.process_subscriptions("worker-b")
+        assert sorted(transport.outbox) == [f"sub{number}@example.com" for number in (1, 2, 4, 5)]
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_missed_days_catch_up_within_the_bound(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        file_path = tmp_path / "long.txt"
+        file_path.write_text(" ".join(f"Sentence {number} ends here." for number in range(400)), encoding="utf-8")
+        book_id = insert_book(
+            title="Long",
+            author="Author",
+            filename="long.txt",
+            file_path=str(file_path),
+            file_type="txt",
+            total_words=1600,
+            total_pages=20,
+        )
+        insert_progress(book_id, pages_per_day=2)
+        monkeypatch.setattr(Config, "WORDS_PER_PAGE", 80)
+        monkeypatch.setattr(Config, "SCHEDULER_CATCH_UP_DAYS", 3)
+        today = date.today()
+        conn = get_connection()
+        with conn:
+            conn.execute(
+                "UPDATE books SET next_due_date = ? WHERE id = ?;",
+                ((today - timedelta(days=5)).isoformat(), book_id),
+            )
+        conn.close()
+
+        monkeypatch.setattr(scheduler, "send_email", lambda *args, **kwargs: None)
+        scheduler.process_books("worker-a")
+
+        detail = get_book_detail(book_id)
+        assert detail["current_page"] == 6
+        assert detail["next_due_date"] == (today + timedelta(days=1)).isoformat()
+        assert claim_due_books("worker-b", today.isoformat()) == []
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_over_budget_books_stream_and_record_their_peak(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        init_db()
+        book_id = _seed_books(tmp_path, 1)[0]
+        monkeypatch.setattr(Config, "BOOK_MEMORY_BUDGET", 1)
+        monkeypatch.setattr(Config, "TRACK_BOOK_MEMORY", True)
+
+        def no_full_read(*args, **kwargs):
+            raise AssertionError("over-budget books must not be read whole")
+
+        monkeypatch.setattr(scheduler, "extract_units", no_full_read)
+        monkeypatch.setattr(scheduler, "send_email", lambda *args, **kwargs: None)
+        scheduler.process_books("worker-a")
+
+        detail = get_book_detail(book_id)
+        assert detail["current_page"] == 1
+        assert detail["peak_memory"] > 0
+    finally:
+        Config.DATABASE_PATH = original_db
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+import db
+from config import Config
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_init_db_skips_migrations_when_schema_is_current(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "data" / "test.db")
+        db.init_db()
+        assert db.get_settings()["default_pages_per_day"] == "1"
+
+        def fail_migrate():
+            raise AssertionError("migrate() should not run on a current schema")
+
+        monkeypatch.setattr(db, "migrate", fail_migrate)
+        db.init_db()
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_scheduler_import_defers_heavy_modules():
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, scheduler; "
+            "print([name for name in ('PyPDF2', 'jinja2', 'smtplib') if name in sys.modules])",
+        ],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert output.strip() == "[]"
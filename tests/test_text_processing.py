@@ -1,4 +1,26 @@
-from text_processing import count_words, split_sentences, chunk_text
+import zipfile
+
+import pytest
+from PyPDF2 import PageObject
+
+import text_processing
+from text_processing import (
+    build_page_index,
+    chunk_text,
+    count_words,
+    extract_pages,
+    extract_units,
+    feed_txt_index,
+    finish_txt_index,
+    index_book,
+    load_sentence_rules,
+    normalize_pdf_units,
+    parse_sentence_rules,
+    probe_pdf,
+    split_sentences,
+    start_txt_index,
+    stream_pages,
+)
 
 
 def test_count_words_basic():
@@ -12,9 +34,261 @@ def test_split_sentences_handles_abbreviations():
     assert sentences == ["Mr. Smith went home.", "He slept."]
 
 
+def test_sentence_rules_cover_initials_ellipses_and_languages():
+    text = "J. R. R. Tolkien wrote it, e.g. in Oxford. Wait... then go. The first. Then."
+    assert split_sentences(text) == [
+        "J. R. R. Tolkien wrote it, e.g. in Oxford.",
+        "Wait... then go.",
+        "The first.",
+        "Then.",
+    ]
+    assert split_sentences("Das kam z.B. spät. Dann ging er.", "de") == ["Das kam z.B. spät.", "Dann ging er."]
+    assert split_sentences("He was taller than I. Then we left.") == ["He was taller than I.", "Then we left."]
+    assert split_sentences("We went with plan B. It worked for John F. Kennedy.") == [
+        "We went with plan B.",
+        "It worked for John F. Kennedy.",
+    ]
+    assert load_sentence_rules("xx") is load_sentence_rules("en")
+
+
+def test_sentence_rules_scale_to_many_abbreviations():
+    abbreviations = [f"ab{number}." for number in range(5000)] + ["mr."]
+    rules = parse_sentence_rules("test", "[abbreviations]\n" + "\n".join(abbreviations))
+    text = "Ab4999. stays. Mr. Smith left. Ab12 is not one. End."
+    assert rules.split(text) == ["Ab4999. stays.", "Mr. Smith left.", "Ab12 is not one.", "End."]
+
+
 def test_chunk_text_respects_sentence_boundaries():
     text = "One. Two. Three. Four. Five."
     chunks = chunk_text(text, words_per_page=2)
     assert len(chunks) >= 2
     for chunk in chunks:
         assert chunk.endswith((".", "!", "?"))
+
+
+def _write_epub(path, chapters):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("mimetype", "application/epub+zip")
+        archive.writestr(
+            "META-INF/container.xml",
+            '<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf"/></rootfiles></container>',
+        )
+        items = "".join(
+            f'<item id="c{i}" href="c{i}.xhtml" media-type="application/xhtml+xml"/>'
+            for i in range(len(chapters))
+        )
+        spine = "".join(f'<itemref idref="c{i}"/>' for i in range(len(chapters)))
+        archive.writestr(
+            "OEBPS/content.opf",
+            '<package xmlns="http://www.idpf.org/2007/opf">'
+            f"<manifest>{items}</manifest><spine>{spine}</spine></package>",
+        )
+        for i, body in enumerate(chapters):
+            archive.writestr(
+                f"OEBPS/c{i}.xhtml",
+                f"<html><head><title>Chapter {i}</title></head><body>{body}</body></html>",
+            )
+
+
+def test_epub_pages_extract_only_their_chapters(tmp_path):
+    epub_path = tmp_path / "book.epub"
+    _write_epub(
+        epub_path,
+        [
+            "<h1>One</h1><p>Alpha beta gamma. Delta epsilon.</p>",
+            "<h1>Two</h1><p>Zeta eta theta. Iota kappa lambda.</p>",
+            "<h1>Three</h1><p>Mu nu xi. Omicron pi rho.</p>",
+        ],
+    )
+    units = extract_units(str(epub_path), "epub")
+    assert units[1] == "Two\n\nZeta eta theta. Iota kappa lambda."
+
+    chunks, index = build_page_index(units, words_per_page=3)
+    assert list(index["source_words"]) == [6, 13, 20]
+
+    last_page = len(chunks)
+    pages = extract_pages(str(epub_path), "epub", index, last_page - 1, last_page)
+    for (content, start, end), expected in zip(pages, chunks[-2:]):
+        assert (start, end) == (expected[1], expected[2])
+        assert content.split() == expected[0].split()
+    assert index["page_sources"][last_page - 1] == 2
+
+
+def _write_pdf(path, page_texts):
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode("latin-1")
+    output += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode("latin-1")
+    path.write_bytes(output)
+
+
+def test_pdf_pages_extract_only_needed_source_pages(tmp_path, monkeypatch):
+    pdf_path = tmp_path / "book.pdf"
+    _write_pdf(
+        pdf_path,
+        ["First page words here.", "Second page words here.", "Third page words here."],
+    )
+    units = extract_units(str(pdf_path), "pdf")
+    chunks, index = build_page_index(units, words_per_page=4)
+    assert list(index["source_words"]) == [4, 8, 12]
+
+    calls = []
+    original = PageObject.extract_text
+
+    def counting_extract_text(self, *args, **kwargs):
+        calls.append(self)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(PageObject, "extract_text", counting_extract_text)
+    pages = extract_pages(str(pdf_path), "pdf", index, 3, 3)
+    assert len(calls) == 1
+    assert pages == [("Third page words here.", 9, 12)]
+    assert chunks[2][0] == "Third page words here."
+
+
+def test_streaming_index_matches_in_memory_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_processing, "TEXT_READ_SIZE", 64)
+    txt_path = tmp_path / "book.txt"
+    txt_path.write_text(
+        " ".join(f"Mr. Smith read part {number}. It was long..." for number in range(60)),
+        encoding="utf-8",
+    )
+    epub_path = tmp_path / "book.epub"
+    _write_epub(epub_path, ["<p>Alpha beta gamma. Delta epsilon.</p>", "<p>Zeta eta. Theta iota kappa.</p>"])
+
+    for path, file_type in ((txt_path, "txt"), (epub_path, "epub")):
+        chunks, expected = build_page_index(extract_units(str(path), file_type), words_per_page=7)
+        in_memory = index_book(str(path), file_type, words_per_page=7)
+        streamed = index_book(str(path), file_type, words_per_page=7, memory_budget=0)
+        assert in_memory["index"] == streamed["index"]
+        assert {key: in_memory["index"][key] for key in expected} == expected
+        assert streamed["total_pages"] == len(chunks)
+        assert stream_pages(str(path), file_type, 2, 3, words_per_page=7) == chunks[1:3]
+
+
+def test_normalize_pdf_units_strips_furniture_and_rejoins_lines():
+    pages = [
+        f"THE LONG ROAD\nChapter {name}\nThe travellers set out on a well-\nknown path through the exam-\nple valley, walking\nuntil dark.\n\nNext morning {name} rose.\n{number}"
+        for number, name in enumerate(("One", "Two", "Three", "Four"), start=1)
+    ]
+    pages.append("THE LONG ROAD\nA well-known ending.\nPage 5 of 5")
+    units = normalize_pdf_units(pages)
+
+    assert units[0] == (
+        "Chapter One The travellers set out on a well-known path through the example valley, "
+        "walking until dark.\n\nNext morning One rose."
+    )
+    assert units[4] == "A well-known ending."
+
+
+def test_pdf_index_serves_pages_from_cached_units(tmp_path):
+    pdf_path = tmp_path / "book.pdf"
+    _write_pdf(pdf_path, [f"Running Title   page body number {number}.   {number}" for number in range(1, 5)])
+    indexed = index_book(str(pdf_path), "pdf", words_per_page=4)
+    assert indexed["units"][0] == "Running Title page body number 1. 1"
+
+    units = indexed["units"]
+    pages = extract_pages(
+        str(pdf_path), "pdf", indexed["index"], 1, indexed["total_pages"], lambda first, last: units[first : last + 1]
+    )
+    chunks, _ = build_page_index(units, words_per_page=4)
+    assert pages == chunks
+
+
+def test_txt_pages_are_read_by_byte_offset(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_processing, "TEXT_READ_SIZE", 64)
+    txt_path = tmp_path / "book.txt"
+    txt_path.write_bytes(
+        b"\r\n".join(
+            f"Caf\u00e9 number {number} \u201cquoted\u201d. Bad ".encode("utf-8") + b"\xff byte here."
+            for number in range(40)
+        )
+    )
+    indexed = index_book(str(txt_path), "txt", words_per_page=9)
+    chunks, _ = build_page_index(extract_units(str(txt_path), "txt"), words_per_page=9)
+    assert len(indexed["index"]["page_offsets"]) == indexed["total_pages"] + 1
+
+    def no_full_read(*args, **kwargs):
+        raise AssertionError("TXT pages must not read the whole file")
+
+    monkeypatch.setattr(text_processing, "extract_units", no_full_read)
+    pages = extract_pages(str(txt_path), "txt", indexed["index"], 2, indexed["total_pages"])
+    for page, chunk in zip(pages, chunks[1:]):
+        assert page[1:] == chunk[1:]
+        assert page[0].split() == chunk[0].split()
+
+
+def test_txt_index_fed_in_chunks_matches_index_book(tmp_path):
+    txt_path = tmp_path / "arriving.txt"
+    data = b"\r\n".join(
+        f"Caf\u00e9 {number} by J. R. R. Tolkien \u201cquoted\u201d. Wait... then go! ".encode("utf-8")
+        + b"\xff byte here. Taller than I. Then plan B."
+        for number in range(60)
+    )
+    txt_path.write_bytes(data)
+    expected = index_book(str(txt_path), "txt", words_per_page=11)
+
+    # Odd chunk sizes split multi-byte characters, words and initials.
+    state = start_txt_index(words_per_page=11)
+    for first in range(0, len(data), 37):
+        feed_txt_index(state, data[first : first + 37])
+    indexed = finish_txt_index(state, str(txt_path))
+
+    assert indexed["total_words"] == expected["total_words"]
+    assert indexed["total_pages"] == expected["total_pages"]
+    for key in ("page_words", "page_sources", "source_words", "page_offsets"):
+        assert indexed["index"][key] == expected["index"][key]
+
+
+def test_image_only_pdf_is_rejected_from_a_sample(tmp_path, monkeypatch):
+    calls = []
+    original = PageObject.extract_text
+
+    def counting_extract_text(self, *args, **kwargs):
+        calls.append(self)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(PageObject, "extract_text", counting_extract_text)
+    scanned_path = tmp_path / "scanned.pdf"
+    _write_pdf(scanned_path, [""] * 40)
+    with pytest.raises(ValueError, match="image-only"):
+        index_book(str(scanned_path), "pdf")
+    assert len(calls) == text_processing.PDF_PROBE_PAGES
+
+    text_path = tmp_path / "text.pdf"
+    _write_pdf(text_path, ["Four words per page."] * 30)
+    estimate = probe_pdf(str(text_path), words_per_page=10)
+    assert estimate["estimated_words"] == 120
+    assert estimate["estimated_pages"] == 12
+
+
+def test_short_pdf_probe_samples_its_last_page(tmp_path):
+    for pages in (["", "Text only on the last page."], ["", "", "", "", "Text starts late."]):
+        path = tmp_path / f"short-{len(pages)}.pdf"
+        _write_pdf(path, pages)
+        estimate = probe_pdf(str(path))
+        assert estimate["sampled_pages"] == len(pages)
+        assert estimate["text_pages"] == 1
+
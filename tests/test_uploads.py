@@ -0,0 +1,120 @@
+import hashlib
+
+import app as app_module
+import uploads
+from app import create_app
+from config import Config
+from db import get_book_detail
+
+
+def _make_client(tmp_path):
+    Config.DATABASE_PATH = str(tmp_path / "test.db")
+    Config.UPLOAD_FOLDER = str(tmp_path / "uploads")
+    return create_app().test_client()
+
+
+def test_chunked_upload_resumes_and_registers_book(tmp_path, monkeypatch):
+    original_db = Config.DATABASE_PATH
+    original_upload = Config.UPLOAD_FOLDER
+    try:
+        client = _make_client(tmp_path)
+        payload = ("Hello wörld. This is a resumable upload. " * 50).encode("utf-8")
+        started = client.post(
+            "/upload/chunked",
+            json={"filename": "resume.txt", "size": len(payload), "title": "Resume"},
+        )
+        assert started.status_code == 201
+        upload_id = started.get_json()["upload_id"]
+
+        # Split inside a multi-byte character and inside a word.
+        split = payload.index("ö".encode("utf-8")) + 1
+        first = client.put(
+            f"/upload/chunked/{upload_id}",
+            data=payload[:split],
+            headers={"Upload-Offset": "0"},
+        )
+        assert first.get_json()["received"] == split
+        assert first.get_json()["words"] == 2
+
+        stale = client.put(
+            f"/upload/chunked/{upload_id}",
+            data=payload[split:],
+            headers={"Upload-Offset": "0"},
+        )
+        assert stale.status_code == 409
+
+        resumed = client.get(f"/upload/chunked/{upload_id}").get_json()
+        client.put(
+            f"/upload/chunked/{upload_id}",
+            data=payload[resumed["received"]:],
+            headers={"Upload-Offset": str(resumed["received"])},
+        )
+
+        preview = client.get(f"/upload/chunked/{upload_id}/preview").get_json()
+        assert preview["estimated_words"] == 350
+
+        def no_second_pass(*args, **kwargs):
+            raise AssertionError("TXT uploads are paginated as they arrive")
+
+        monkeypatch.setattr(app_module, "index_book", no_second_pass)
+        done = client.post(
+            f"/upload/chunked/{upload_id}/complete",
+            json={"sha256": hashlib.sha256(payload).hexdigest()},
+        )
+        assert done.status_code == 201
+        details = done.get_json()
+        assert details["total_words"] == 350
+        assert get_book_detail(details["book_id"])["title"] == "Resume"
+    finally:
+        Config.DATABASE_PATH = original_db
+        Config.UPLOAD_FOLDER = original_upload
+
+
+def test_chunked_upload_rejects_bad_magic_bytes(tmp_path):
+    original_db = Config.DATABASE_PATH
+    original_upload = Config.UPLOAD_FOLDER
+    try:
+        client = _make_client(tmp_path)
+        payload = b"not a pdf " * 200
+        upload_id = client.post(
+            "/upload/chunked",
+            json={"filename": "fake.pdf", "size": len(payload)},
+        ).get_json()["upload_id"]
+
+        response = client.put(
+            f"/upload/chunked/{upload_id}",
+            data=payload,
+            headers={"Upload-Offset": "0"},
+        )
+        assert response.status_code == 400
+        assert client.get(f"/upload/chunked/{upload_id}").status_code == 404
+        assert upload_id not in uploads._hashers
+    finally:
+        Config.DATABASE_PATH = original_db
+        Config.UPLOAD_FOLDER = original_upload
+
+
+def test_abandoned_uploads_expire_with_their_hashers(tmp_path):
+    original_db = Config.DATABASE_PATH
+    original_upload = Config.UPLOAD_FOLDER
+    try:
+        client = _make_client(tmp_path)
+        payload = b"Some words that never finish uploading. " * 10
+        upload_id = client.post(
+            "/upload/chunked",
+            json={"filename": "abandoned.txt", "size": len(payload)},
+        ).get_json()["upload_id"]
+        client.put(
+            f"/upload/chunked/{upload_id}",
+            data=payload[:100],
+            headers={"Upload-Offset": "0"},
+        )
+        assert upload_id in uploads._hashers
+
+        assert uploads.expire_uploads() == 0
+        assert uploads.expire_uploads(max_age=-1) == 1
+        assert upload_id not in uploads._hashers
+        assert client.get(f"/upload/chunked/{upload_id}").status_code == 404
+    finally:
+        Config.DATABASE_PATH = original_db
+        Config.UPLOAD_FOLDER = original_upload
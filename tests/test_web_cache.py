@@ -0,0 +1,50 @@
+import gzip
+import re
+
+from app import create_app
+from config import Config
+from db import insert_book, insert_progress
+
+
+def test_static_urls_are_fingerprinted_and_compressed(tmp_path):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        client = create_app().test_client()
+
+        page = client.get("/")
+        match = re.search(r'href="(/static/style\.css\?v=\w+)"', page.get_data(as_text=True))
+        assert match
+
+        response = client.get(match.group(1), headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "immutable" in response.headers["Cache-Control"]
+        assert b"font-family" in gzip.decompress(response.get_data())
+    finally:
+        Config.DATABASE_PATH = original_db
+
+
+def test_library_fragment_is_invalidated_by_writes(tmp_path):
+    original_db = Config.DATABASE_PATH
+    try:
+        Config.DATABASE_PATH = str(tmp_path / "test.db")
+        client = create_app().test_client()
+        assert b"No books yet" in client.get("/").get_data()
+
+        book_id = insert_book(
+            title="Fresh Title",
+            author="Author",
+            filename="fresh.txt",
+            file_path="fresh.txt",
+            file_type="txt",
+            total_words=10,
+            total_pages=1,
+        )
+        insert_progress(book_id, pages_per_day=1)
+
+        first = client.get("/")
+        assert b"Fresh Title" in first.get_data()
+        etag = first.headers["ETag"]
+        assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+    finally:
+        Config.DATABASE_PATH = original_db
@@ -1,65 +1,153 @@
+import codecs
+import mmap
+import os
+import posixpath
 import re
-
-from PyPDF2 import PdfReader
+import zipfile
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from html.parser import HTMLParser
+from urllib.parse import unquote
+from xml.etree import ElementTree
 
 from config import Config
 
-ABBREVIATIONS = {
-    "mr.",
-    "mrs.",
-    "ms.",
-    "dr.",
-    "prof.",
-    "sr.",
-    "jr.",
-    "st.",
-    "vs.",
-    "etc.",
+WORD_RE = re.compile(r"\b\w+\b")
+EPUB_READ_SIZE = 64 * 1024
+TEXT_READ_SIZE = 1024 * 1024
+# Rough peak bytes of Python objects per byte on disk when a whole book is
+# extracted and chunked in memory (text, sentences and pages all coexist).
+MEMORY_FACTORS = {"txt": 12, "pdf": 2, "epub": 36}
+# Pages, spread across the document, read to judge a PDF before a full parse.
+PDF_PROBE_PAGES = 8
+HTML_MEDIA_TYPES = {"application/xhtml+xml", "text/html"}
+
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sentence_rules")
+_BOUNDARY_PATTERN = r"(?P<boundary>(?<=[.!?])\s+(?=[A-Za-z]))"
+# Rules a language file can switch on under [rules].
+_OPTIONAL_RULES = {
+    # Two or more initials ("J. R. R."), or one after a capitalized name
+    # ("John F."). A lone capital after a lowercase word ("plan B.", "than I.")
+    # may end a sentence, and "I." never starts a middle initial.
+    "initials": r"(?-i:\b(?:[A-Z]\.\s*)+[A-Z]\.|\b[A-Z][a-z]+\s+[A-HJ-Z]\.)",
+    "ellipsis": r"(?-i:\.\.\.(?=\s+[a-z]))",
 }
 
 
-def _protect_abbreviations(text):
-    for abbr in ABBREVIATIONS:
-        escaped = re.escape(abbr)
-        text = re.sub(
-            escaped,
-            lambda match: match.group(0).replace(".", "<DOT>"),
-            text,
-            flags=re.IGNORECASE,
-        )
-    return text
+class SentenceRules:
+    def __init__(self, language, abbreviations=(), rules=()):
+        unknown = set(rules) - set(_OPTIONAL_RULES)
+        if unknown:
+            raise ValueError(f"Unknown sentence rules for {language}: {', '.join(sorted(unknown))}")
+        self.language = language
+        self.abbreviations = frozenset(abbr.lower() for abbr in abbreviations)
+        self.rules = tuple(rules)
+        keep = [_OPTIONAL_RULES[rule] for rule in self.rules]
+        if self.abbreviations:
+            keep.insert(0, r"\b" + _trie_pattern(self.abbreviations))
+        # One scan finds both boundaries and the tokens that must not end a
+        # sentence; a "keep" match swallows its trailing space so no boundary
+        # can start inside it. The abbreviations form a trie, so each position
+        # costs the same however many are configured.
+        pattern = _BOUNDARY_PATTERN
+        if keep:
+            pattern = rf"(?P<keep>(?:{'|'.join(keep)})\s*)|{pattern}"
+        self.scanner = re.compile(pattern, re.IGNORECASE)
+
+    def split(self, text):
+        return list(self.iter_split([text]))
+
+    def iter_split(self, blocks):
+        """Split text arriving in blocks, as if the blocks were one string.
+
+        Only the unfinished sentence after the last boundary is carried into
+        the next block, so memory stays bounded by the longest sentence.
+        """
+        carry = ""
+        for block in blocks:
+            text = carry + block
+            start = 0
+            for match in self.scanner.finditer(text):
+                if match.lastgroup == "boundary":
+                    sentence = text[start : match.start()].strip()
+                    if sentence:
+                        yield sentence
+                    start = match.end()
+            carry = text[start:]
+        tail = carry.strip()
+        if tail:
+            yield tail
+
+
+def _trie_pattern(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return _trie_node_pattern(trie)
+
 
+def _trie_node_pattern(node):
+    branches = [re.escape(char) + _trie_node_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    if len(branches) == 1 and "" not in node:
+        return branches[0]
+    return f"(?:{'|'.join(branches)})" + ("?" if "" in node else "")
 
-def _restore_abbreviations(text):
-    return text.replace("<DOT>", ".")
 
+def parse_sentence_rules(language, source):
+    sections = {"abbreviations": [], "rules": []}
+    section = None
+    for line in source.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1].strip().lower()
+            if section not in sections:
+                raise ValueError(f"Unknown section [{section}] in {language} sentence rules.")
+            continue
+        if section is None:
+            raise ValueError(f"Entry outside a section in {language} sentence rules: {line}")
+        sections[section].append(line)
+    return SentenceRules(language, sections["abbreviations"], sections["rules"])
+
+
+@lru_cache(maxsize=None)
+def load_sentence_rules(language=None):
+    language = (language or Config.SENTENCE_LANGUAGE).lower()
+    path = os.path.join(RULES_DIR, f"{language}.txt")
+    if not os.path.exists(path) and language != "en":
+        return load_sentence_rules("en")
+    with open(path, "r", encoding="utf-8") as handle:
+        return parse_sentence_rules(language, handle.read())
 
-def split_sentences(text):
-    protected = _protect_abbreviations(text)
-    parts = re.split(r"(?<=[.!?])\s+(?=[A-Za-z])", protected)
-    return [_restore_abbreviations(part.strip()) for part in parts if part.strip()]
+
+def split_sentences(text, language=None):
+    return load_sentence_rules(language).split(text)
 
 
 def count_words(text):
-    return len(re.findall(r"\b\w+\b", text))
+    return len(WORD_RE.findall(text))
 
 
-def chunk_text(text, words_per_page=None):
-    words_per_page = words_per_page or Config.WORDS_PER_PAGE
-    sentences = split_sentences(text)
-    chunks = []
+def _iter_chunks(sentences, words_per_page):
     current = []
     current_words = 0
 
     for sentence in sentences:
         sentence_words = count_words(sentence)
         if current and current_words >= words_per_page:
-            chunks.append(" ".join(current).strip())
+            yield " ".join(current).strip()
             current = []
             current_words = 0
 
         if current and current_words + sentence_words > words_per_page:
-            chunks.append(" ".join(current).strip())
+            yield " ".join(current).strip()
             current = [sentence]
             current_words = sentence_words
             continue
@@ -68,36 +156,667 @@ def chunk_text(text, words_per_page=None):
         current_words += sentence_words
 
     if current:
-        chunks.append(" ".join(current).strip())
+        yield " ".join(current).strip()
 
-    return chunks
+
+def chunk_text(text, words_per_page=None, language=None):
+    words_per_page = words_per_page or Config.WORDS_PER_PAGE
+    return list(_iter_chunks(split_sentences(text, language), words_per_page))
 
 
-def chunk_text_with_word_ranges(text, words_per_page=None):
-    chunks = chunk_text(text, words_per_page)
-    results = []
+def iter_pages(blocks, words_per_page=None, language=None):
+    """Yield ``(chunk, word_start, word_end)`` pages from text arriving in blocks."""
+    words_per_page = words_per_page or Config.WORDS_PER_PAGE
     word_pos = 0
-    for chunk in chunks:
+    for chunk in _iter_chunks(load_sentence_rules(language).iter_split(blocks), words_per_page):
         chunk_words = count_words(chunk)
-        start = word_pos + 1
-        end = word_pos + chunk_words
-        results.append((chunk, start, end))
-        word_pos = end
-    return results
+        yield chunk, word_pos + 1, word_pos + chunk_words
+        word_pos += chunk_words
 
 
-def extract_text(file_path, file_type):
+def chunk_text_with_word_ranges(text, words_per_page=None, language=None):
+    return list(iter_pages([text], words_per_page, language))
+
+
+class _HTMLTextExtractor(HTMLParser):
+    BLOCK_TAGS = {
+        "address", "article", "aside", "blockquote", "br", "dd", "div", "dl",
+        "dt", "figcaption", "footer", "h1", "h2", "h3", "h4", "h5", "h6",
+        "header", "hr", "li", "ol", "p", "pre", "section", "table", "tr", "ul",
+    }
+    SKIP_TAGS = {"head", "script", "style", "title"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self._current = []
+        self._skip_depth = 0
+
+    def _end_block(self):
+        block = " ".join("".join(self._current).split())
+        if block:
+            self.blocks.append(block)
+        self._current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self._end_block()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.BLOCK_TAGS:
+            self._end_block()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self._end_block()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._current.append(data)
+
+    def text(self):
+        self._end_block()
+        return "\n\n".join(self.blocks)
+
+
+def epub_chapters(archive):
+    container = ElementTree.fromstring(archive.read("META-INF/container.xml"))
+    rootfile = container.find(".//{*}rootfile")
+    if rootfile is None:
+        raise ValueError("EPUB container does not name a package file.")
+    opf_path = rootfile.get("full-path")
+    opf_dir = posixpath.dirname(opf_path)
+    package = ElementTree.fromstring(archive.read(opf_path))
+
+    manifest = {}
+    for item in package.iterfind(".//{*}manifest/{*}item"):
+        if item.get("media-type") in HTML_MEDIA_TYPES:
+            href = posixpath.normpath(posixpath.join(opf_dir, unquote(item.get("href", ""))))
+            manifest[item.get("id")] = href
+    chapters = []
+    for itemref in package.iterfind(".//{*}spine/{*}itemref"):
+        href = manifest.get(itemref.get("idref"))
+        if href and href not in chapters:
+            chapters.append(href)
+    return chapters
+
+
+def extract_epub_chapter(archive, name):
+    parser = _HTMLTextExtractor()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with archive.open(name) as handle:
+        for block in iter(lambda: handle.read(EPUB_READ_SIZE), b""):
+            parser.feed(decoder.decode(block))
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    return parser.text()
+
+
+def _read_epub_units(file_path, first=0, last=None):
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            chapters = epub_chapters(archive)
+            last = len(chapters) - 1 if last is None else last
+            return [extract_epub_chapter(archive, name) for name in chapters[first : last + 1]]
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as exc:
+        raise ValueError(f"Invalid EPUB file: {exc}") from exc
+
+
+def _read_pdf_units(file_path, first=0, last=None):
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(file_path)
+    pages = reader.pages
+    last = len(pages) - 1 if last is None else last
+    return [pages[number].extract_text() or "" for number in range(first, last + 1)]
+
+
+def probe_pdf(file_path, words_per_page=None, samples=None):
+    """Estimate a PDF's words and pages from a spread of sampled pages.
+
+    Raises ValueError when no sampled page has text (scanned or image-only
+    files), so they are rejected after ``samples`` pages instead of all.
+    """
+    from PyPDF2 import PdfReader
+
+    words_per_page = words_per_page or Config.WORDS_PER_PAGE
+    samples = samples or PDF_PROBE_PAGES
+    try:
+        pages = PdfReader(file_path).pages
+        source_pages = len(pages)
+        sampled = min(samples, source_pages)
+        step = (source_pages - 1) / max(1, sampled - 1)
+        picks = sorted({round(number * step) for number in range(sampled)})
+        sampled_words = [count_words(pages[number].extract_text() or "") for number in picks]
+    except Exception as exc:
+        raise ValueError(f"Invalid PDF file: {exc}") from exc
+    text_pages = sum(1 for words in sampled_words if words)
+    if not text_pages:
+        raise ValueError("No text could be extracted from this PDF. It may be a scanned or image-only document.")
+    estimated_words = round(sum(sampled_words) / len(picks) * source_pages)
+    return {
+        "source_pages": source_pages,
+        "sampled_pages": len(picks),
+        "text_pages": text_pages,
+        "estimated_words": estimated_words,
+        "estimated_pages": max(1, -(-estimated_words // words_per_page)),
+    }
+
+
+_PAGE_NUMBER_RE = re.compile(r"^\W*(?:page\s+)?\d+(?:\s*(?:of|/)\s*\d+)?\W*$", re.IGNORECASE)
+_HYPHENATED_RE = re.compile(r"\b\w+-\w+\b")
+_SPACE_RUN_RE = re.compile(r"[ \t\u00a0]+")
+# Lines at each end of a page that may hold a running header or footer.
+EDGE_LINES = 2
+PARAGRAPH_END = (".", "!", "?", ":", '"', "\u201d")
+
+
+def _edge_key(line):
+    return re.sub(r"\d+", "#", line.lower())
+
+
+def _edge_indexes(lines):
+    filled = [number for number, line in enumerate(lines) if line]
+    # A page extracted as one or two lines has no separate furniture.
+    if len(filled) <= EDGE_LINES:
+        return set()
+    return set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+
+
+def normalize_pdf_units(pages):
+    """Clean PyPDF2 page text once, before it is paginated and cached.
+
+    Drops page numbers and running headers/footers (edge lines repeated on
+    many pages, digits ignored), rejoins hard-wrapped lines and words
+    hyphenated across lines, and collapses runs of whitespace.
+    """
+    page_lines = [[line.strip() for line in page.splitlines()] for page in pages]
+    repeated = set()
+    if len(page_lines) >= 3:
+        counts = {}
+        for lines in page_lines:
+            for key in {_edge_key(lines[number]) for number in _edge_indexes(lines)}:
+                counts[key] = counts.get(key, 0) + 1
+        threshold = max(3, (len(page_lines) * 2 + 4) // 5)
+        repeated = {key for key, count in counts.items() if count >= threshold}
+
+    vocabulary = set()
+    hyphenated = set()
+    for page in pages:
+        lowered = page.lower()
+        vocabulary.update(WORD_RE.findall(lowered))
+        hyphenated.update(_HYPHENATED_RE.findall(lowered))
+    return [_normalize_pdf_page(lines, repeated, vocabulary, hyphenated) for lines in page_lines]
+
+
+def _normalize_pdf_page(lines, repeated, vocabulary, hyphenated):
+    edges = _edge_indexes(lines)
+    kept = [
+        line
+        for number, line in enumerate(lines)
+        if not (number in edges and (_PAGE_NUMBER_RE.match(line) or _edge_key(line) in repeated))
+    ]
+    widths = sorted(len(line) for line in kept if line)
+    short = widths[len(widths) // 2] * 0.6 if widths else 0
+
+    paragraphs = []
+    current = ""
+    for line in kept:
+        if not line:
+            if current:
+                paragraphs.append(current)
+            current = ""
+            continue
+        if not current:
+            current = line
+        elif current.endswith("-") and current[-2:-1].isalpha() and line[:1].islower():
+            current = _join_hyphenated(current, line, vocabulary, hyphenated)
+        else:
+            current = f"{current} {line}"
+        # A short line ending a sentence closes its paragraph.
+        if len(line) < short and line.endswith(PARAGRAPH_END):
+            paragraphs.append(current)
+            current = ""
+    if current:
+        paragraphs.append(current)
+    return "\n\n".join(_SPACE_RUN_RE.sub(" ", paragraph) for paragraph in paragraphs)
+
+
+def _join_hyphenated(current, line, vocabulary, hyphenated):
+    head = current[:-1]
+    first = head.rsplit(" ", 1)[-1].lower()
+    second = line.split(" ", 1)[0].lower()
+    second_word = WORD_RE.match(second)
+    second_word = second_word.group(0) if second_word else second
+    # Keep the hyphen only when the document uses the hyphenated form and
+    # never the joined one ("well-known" vs "exam-ple").
+    if f"{first}-{second_word}" in hyphenated and f"{first}{second_word}" not in vocabulary:
+        return f"{current}{line}"
+    return f"{head}{line}"
+
+
+def extract_units(file_path, file_type, normalize=True):
     if file_type == "txt":
         with open(file_path, "r", encoding="utf-8", errors="replace") as handle:
-            return handle.read()
+            return [handle.read()]
     if file_type == "pdf":
-        reader = PdfReader(file_path)
-        pages = []
-        for page in reader.pages:
-            page_text = page.extract_text() or ""
-            pages.append(page_text)
-        text = "\n".join(pages)
-        if not text.strip():
+        units = _read_pdf_units(file_path)
+        if normalize:
+            units = normalize_pdf_units(units)
+        if not "".join(units).strip():
             raise ValueError("No text could be extracted from this PDF.")
-        return text
+        return units
+    if file_type == "epub":
+        units = _read_epub_units(file_path)
+        if not "".join(units).strip():
+            raise ValueError("No text could be extracted from this EPUB.")
+        return units
     raise ValueError(f"Unsupported file type: {file_type}")
+
+
+def build_page_index(units, words_per_page=None):
+    chunks = chunk_text_with_word_ranges("\n".join(units), words_per_page)
+    source_words = array("I")
+    total = 0
+    for unit in units:
+        total += count_words(unit)
+        source_words.append(total)
+
+    page_words = array("I")
+    page_sources = array("I")
+    for _, word_start, word_end in chunks:
+        page_words.append(word_end)
+        page_sources.append(bisect_left(source_words, word_start))
+    return chunks, {
+        "page_words": page_words,
+        "page_sources": page_sources,
+        "source_words": source_words,
+    }
+
+
+def estimate_memory(file_path, file_type):
+    return os.path.getsize(file_path) * MEMORY_FACTORS.get(file_type, 12)
+
+
+def _iter_txt_blocks(file_path):
+    # Blocks end on whitespace so no word is split between two of them.
+    carry = ""
+    with open(file_path, "r", encoding="utf-8", errors="replace") as handle:
+        for block in iter(lambda: handle.read(TEXT_READ_SIZE), ""):
+            text = carry + block
+            cut = max(text.rfind(" "), text.rfind("\n"))
+            if cut < 0:
+                carry = text
+                continue
+            carry = text[cut:]
+            yield text[:cut]
+    if carry:
+        yield carry
+
+
+def _iter_txt_byte_blocks(file_path):
+    # UTF-8 never uses ASCII bytes inside a multi-byte sequence, so cutting
+    # on ASCII whitespace splits neither characters nor words.
+    carry = b""
+    with open(file_path, "rb") as handle:
+        for block in iter(lambda: handle.read(TEXT_READ_SIZE), b""):
+            data = carry + block
+            cut = max(data.rfind(b" "), data.rfind(b"\n"))
+            if cut < 0:
+                carry = data
+                continue
+            carry = data[cut:]
+            yield data[:cut]
+    if carry:
+        yield carry
+
+
+def build_txt_page_offsets(file_path, page_words):
+    """Byte offset where each page of a TXT book starts, then the file size.
+
+    Page starts are found by word position, so this needs one streaming pass
+    and no re-pagination.
+    """
+    targets = iter(page_words[:-1])
+    target = 0 if page_words else None
+    offsets = array("Q")
+    words = 0
+    base = 0
+    for block in _iter_txt_byte_blocks(file_path):
+        if target is None:
+            break
+        # surrogateescape keeps undecodable bytes one char each, so encoding
+        # a prefix again gives its exact length in the file.
+        text = block.decode("utf-8", "surrogateescape")
+        char_pos = 0
+        byte_pos = base
+        previous_end = 0
+        for match in WORD_RE.finditer(text):
+            while target == words:
+                start = match.start()
+                while start > previous_end and not text[start - 1].isspace():
+                    start -= 1
+                byte_pos += len(text[char_pos:start].encode("utf-8", "surrogateescape"))
+                char_pos = start
+                offsets.append(byte_pos)
+                target = next(targets, None)
+            previous_end = match.end()
+            words += 1
+        base += len(block)
+    offsets.append(os.path.getsize(file_path))
+    return offsets
+
+
+def start_txt_index(words_per_page=None, language=None):
+    """Empty state for ``feed_txt_index``.
+
+    The state is plain JSON so an upload can persist it between chunks.
+    """
+    return {
+        "words_per_page": words_per_page or Config.WORDS_PER_PAGE,
+        "language": (language or Config.SENTENCE_LANGUAGE).lower(),
+        "decoder_state": "",
+        "carry": "",
+        "carry_offset": 0,
+        "words": 0,
+        "page_open": False,
+        "page_words": 0,
+        "page_ends": [],
+        "page_offsets": [],
+    }
+
+
+def feed_txt_index(state, data, final=False):
+    """Paginate the next bytes of a TXT book, as ``index_book`` would.
+
+    Only the unfinished sentence is carried between calls. Page ends and
+    start offsets accumulate in ``state`` for ``finish_txt_index``.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="surrogateescape")
+    decoder.setstate((bytes.fromhex(state["decoder_state"]), 0))
+    text = state["carry"] + decoder.decode(data, final=final)
+    state["decoder_state"] = decoder.getstate()[0].hex()
+    # A boundary right at the end may belong to a token still arriving
+    # ("J. R" before "R."), so only those before the last space are final.
+    limit = len(text) if final else max(text.rfind(" "), text.rfind("\n"))
+    char_pos = 0
+    byte_pos = state["carry_offset"]
+
+    def offset_of(position):
+        # Byte offsets are found by encoding only the text between calls.
+        nonlocal char_pos, byte_pos
+        if position >= char_pos:
+            byte_pos += len(text[char_pos:position].encode("utf-8", "surrogateescape"))
+        else:
+            byte_pos -= len(text[position:char_pos].encode("utf-8", "surrogateescape"))
+        char_pos = position
+        return byte_pos
+
+    if not state["page_offsets"]:
+        # The first page starts at its first word, extended back over any
+        # punctuation attached to it, as build_txt_page_offsets finds it.
+        match = WORD_RE.search(text, 0, max(limit, 0))
+        if match:
+            start = match.start()
+            while start > 0 and not text[start - 1].isspace():
+                start -= 1
+            state["page_offsets"].append(offset_of(start))
+
+    start = 0
+    for match in load_sentence_rules(state["language"]).scanner.finditer(text):
+        if match.lastgroup != "boundary":
+            continue
+        if match.end() > limit:
+            break
+        _add_txt_sentence(state, text, start, match.start(), offset_of)
+        start = match.end()
+    if final:
+        _add_txt_sentence(state, text, start, len(text), offset_of)
+        if state["page_open"]:
+            state["words"] += state["page_words"]
+            state["page_ends"].append(state["words"])
+            state["page_open"] = False
+        text, start = "", 0
+    state["carry_offset"] = offset_of(start)
+    state["carry"] = text[start:]
+    return state
+
+
+def _add_txt_sentence(state, text, start, end, offset_of):
+    # The same page decisions as _iter_chunks, made from word counts alone.
+    raw = text[start:end]
+    sentence = raw.strip()
+    if not sentence:
+        return
+    sentence_words = count_words(sentence)
+    close = state["page_open"] and (
+        state["page_words"] >= state["words_per_page"]
+        or state["page_words"] + sentence_words > state["words_per_page"]
+    )
+    if close:
+        state["words"] += state["page_words"]
+        state["page_ends"].append(state["words"])
+        state["page_offsets"].append(offset_of(start + len(raw) - len(raw.lstrip())))
+        state["page_words"] = 0
+    state["page_open"] = True
+    state["page_words"] += sentence_words
+
+
+def txt_index_words(state):
+    """Words fed to ``feed_txt_index`` so far, counting the unfinished sentence."""
+    return state["words"] + state["page_words"] + count_words(state["carry"])
+
+
+def finish_txt_index(state, file_path):
+    """``index_book``'s result for a TXT book fed through ``feed_txt_index``."""
+    if state["carry"] or state["page_open"]:
+        feed_txt_index(state, b"", final=True)
+    page_words = array("I", state["page_ends"])
+    total = page_words[-1] if page_words else 0
+    offsets = array("Q", state["page_offsets"][: len(page_words)])
+    offsets.append(os.path.getsize(file_path))
+    return {
+        "total_words": total,
+        "total_pages": len(page_words),
+        "index": {
+            "page_words": page_words,
+            "page_sources": array("I", [0] * len(page_words)),
+            "source_words": array("I", [total]),
+            "page_offsets": offsets,
+        },
+        "units": None,
+        "memory_estimate": estimate_memory(file_path, "txt"),
+    }
+
+
+def _read_txt_pages(file_path, index, first_page, last_page):
+    # Only the requested pages' bytes are touched; the mapping shares the OS
+    # page cache with every other process reading the same book.
+    offsets = index["page_offsets"]
+    pages = []
+    with open(file_path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for page in range(first_page, last_page + 1):
+            data = mapped[offsets[page - 1] : offsets[page]]
+            content = data.decode("utf-8", "replace").replace("\r\n", "\n").strip()
+            pages.append((content, *page_word_range(index, page)))
+    return pages
+
+
+def iter_unit_blocks(file_path, file_type, normalize=True):
+    """Yield ``(unit, block)`` text pairs one block at a time.
+
+    TXT files are a single unit read in TEXT_READ_SIZE blocks; PDF pages and
+    EPUB chapters are one block each.
+    """
+    if file_type == "txt":
+        for block in _iter_txt_blocks(file_path):
+            yield 0, block
+    elif file_type == "pdf":
+        # Header detection needs every page, but PDF text is small next to
+        # the file itself.
+        units = _read_pdf_units(file_path)
+        yield from enumerate(normalize_pdf_units(units) if normalize else units)
+    elif file_type == "epub":
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                for number, name in enumerate(epub_chapters(archive)):
+                    yield number, extract_epub_chapter(archive, name)
+        except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as exc:
+            raise ValueError(f"Invalid EPUB file: {exc}") from exc
+    else:
+        raise ValueError(f"Unsupported file type: {file_type}")
+
+
+def _joined_blocks(unit_blocks):
+    # Matches "\n".join(units), which the in-memory path chunks.
+    previous = None
+    for unit, block in unit_blocks:
+        if previous is not None and unit != previous:
+            yield "\n"
+        previous = unit
+        yield block
+
+
+def build_page_index_streaming(file_path, file_type, words_per_page=None, normalize=True):
+    """Page count and index of a book without holding its text or pages."""
+    return _page_index_from_blocks(iter_unit_blocks(file_path, file_type, normalize), words_per_page)
+
+
+def _page_index_from_blocks(unit_blocks, words_per_page=None):
+    source_words = array("I")
+    unit_words = []
+
+    def counted_blocks():
+        for unit, block in unit_blocks:
+            if unit == len(unit_words):
+                unit_words.append(0)
+            unit_words[unit] += count_words(block)
+            yield unit, block
+
+    page_words = array("I")
+    page_starts = array("I")
+    for _, word_start, word_end in iter_pages(_joined_blocks(counted_blocks()), words_per_page):
+        page_starts.append(word_start)
+        page_words.append(word_end)
+
+    total = 0
+    for words in unit_words:
+        total += words
+        source_words.append(total)
+    page_sources = array("I", (bisect_left(source_words, start) for start in page_starts))
+    return {
+        "page_words": page_words,
+        "page_sources": page_sources,
+        "source_words": source_words,
+    }
+
+
+def stream_pages(file_path, file_type, first_page, last_page, words_per_page=None):
+    """Pages ``first_page``..``last_page`` read front to back, keeping only those pages."""
+    pages = []
+    blocks = _joined_blocks(iter_unit_blocks(file_path, file_type))
+    for number, page in enumerate(iter_pages(blocks, words_per_page), start=1):
+        if number > last_page:
+            break
+        if number >= first_page:
+            pages.append(page)
+    return pages
+
+
+def index_book(file_path, file_type, words_per_page=None, memory_budget=None):
+    """Paginate a book at ingest, streaming it when it would not fit the memory budget."""
+    memory_budget = Config.BOOK_MEMORY_BUDGET if memory_budget is None else memory_budget
+    memory_estimate = estimate_memory(file_path, file_type)
+    units = None
+    if file_type == "pdf":
+        probe_pdf(file_path, words_per_page)
+        # Normalized PDF pages are returned for caching, so deliveries never
+        # re-run PyPDF2 or the normalizer.
+        units = extract_units(file_path, file_type)
+        if memory_estimate > memory_budget:
+            index = _page_index_from_blocks(enumerate(units), words_per_page)
+        else:
+            _, index = build_page_index(units, words_per_page)
+    elif memory_estimate > memory_budget:
+        index = build_page_index_streaming(file_path, file_type, words_per_page)
+    else:
+        _, index = build_page_index(extract_units(file_path, file_type), words_per_page)
+    if file_type == "txt":
+        index["page_offsets"] = build_txt_page_offsets(file_path, index["page_words"])
+    page_words = index["page_words"]
+    return {
+        "total_words": page_words[-1] if page_words else 0,
+        "total_pages": len(page_words),
+        "index": index,
+        "units": units,
+        "memory_estimate": memory_estimate,
+    }
+
+
+def page_word_range(index, page):
+    page_words = index["page_words"]
+    word_start = page_words[page - 2] + 1 if page > 1 else 1
+    return word_start, page_words[page - 1]
+
+
+def _slice_words(text, matches, first, last):
+    # Extend each edge over adjoining punctuation (quotes, full stops) up to the
+    # surrounding whitespace so the slice matches the sentence-based chunks.
+    start = matches[first].start()
+    floor = matches[first - 1].end() if first > 0 else 0
+    while start > floor and not text[start - 1].isspace():
+        start -= 1
+    end = matches[last].end()
+    ceiling = matches[last + 1].start() if last + 1 < len(matches) else len(text)
+    while end < ceiling and not text[end].isspace():
+        end += 1
+    return text[start:end].strip()
+
+
+def supports_page_ranges(file_type):
+    return file_type in {"epub", "pdf", "txt"}
+
+
+def extract_pages(file_path, file_type, index, first_page, last_page, read_units=None):
+    """Pages ``first_page``..``last_page`` from only the source units holding them.
+
+    ``read_units(first_unit, last_unit)`` supplies cached units instead of
+    reading them from the file; it returns None when nothing is cached. TXT
+    books are read by the byte offsets in ``index["page_offsets"]``.
+    """
+    if file_type == "txt":
+        return _read_txt_pages(file_path, index, first_page, last_page)
+    source_words = index["source_words"]
+    word_start = page_word_range(index, first_page)[0]
+    word_end = page_word_range(index, last_page)[1]
+    first_unit = bisect_left(source_words, word_start)
+    last_unit = bisect_left(source_words, word_end)
+    base = source_words[first_unit - 1] if first_unit > 0 else 0
+
+    units = read_units(first_unit, last_unit) if read_units is not None else None
+    if units is None:
+        if file_type == "epub":
+            units = _read_epub_units(file_path, first_unit, last_unit)
+        elif file_type == "pdf":
+            # Only books indexed before PDF normalization land here; their
+            # index counts the raw PyPDF2 text.
+            units = _read_pdf_units(file_path, first_unit, last_unit)
+        else:
+            raise ValueError(f"Page ranges are not supported for {file_type} files.")
+
+    text = "\n".join(units)
+    matches = list(WORD_RE.finditer(text))
+    pages = []
+    for page in range(first_page, last_page + 1):
+        page_start, page_end = page_word_range(index, page)
+        content = _slice_words(text, matches, page_start - base - 1, page_end - base - 1)
+        pages.append((content, page_start, page_end))
+    return pages
+
+
+def extract_text(file_path, file_type):
+    return "\n".join(extract_units(file_path, file_type))
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from config import Config
+from text_processing import feed_txt_index, finish_txt_index, start_txt_index
+
+
+PARTIAL_DIR_NAME = ".partial"
+STREAM_BLOCK_SIZE = 64 * 1024
+MAGIC_HEAD_SIZE = 1024
+
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+def _partial_dir():
+    return os.path.join(Config.UPLOAD_FOLDER, PARTIAL_DIR_NAME)
+
+
+def _state_path(upload_id):
+    return os.path.join(_partial_dir(), f"{upload_id}.json")
+
+
+def data_path(upload_id):
+    return os.path.join(_partial_dir(), f"{upload_id}.part")
+
+
+def unique_upload_path(filename, file_ext, reserved=None):
+    os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+    base_name = os.path.splitext(filename)[0]
+    file_path = os.path.join(Config.UPLOAD_FOLDER, filename)
+    counter = 1
+    while os.path.exists(file_path) or (reserved and os.path.abspath(file_path) in reserved):
+        file_path = os.path.join(
+            Config.UPLOAD_FOLDER,
+            f"{base_name}-{counter}.{file_ext}",
+        )
+        counter += 1
+    return os.path.abspath(file_path)
+
+
+def _save_state(state):
+    path = _state_path(state["upload_id"])
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(state, handle)
+    os.replace(tmp_path, path)
+
+
+def validate_head(file_type, head, final=False):
+    if file_type == "pdf":
+        if len(head) >= MAGIC_HEAD_SIZE or final:
+            if b"%PDF-" not in head[:MAGIC_HEAD_SIZE]:
+                raise ValueError("File does not look like a PDF.")
+    elif file_type == "epub":
+        if len(head) >= 4 and not head.startswith(b"PK\x03\x04"):
+            raise ValueError("File does not look like an EPUB.")
+    elif file_type == "txt":
+        if b"\x00" in head:
+            raise ValueError("File does not look like plain text.")
+
+
+def start_upload(filename, file_type, total_size, metadata=None):
+    if total_size <= 0:
+        raise ValueError("Upload size must be positive.")
+    if total_size > Config.MAX_UPLOAD_SIZE:
+        raise ValueError("File is too large.")
+
+    os.makedirs(_partial_dir(), exist_ok=True)
+    expire_uploads()
+    upload_id = uuid.uuid4().hex
+    state = {
+        "upload_id": upload_id,
+        "filename": filename,
+        "file_type": file_type,
+        "total_size": total_size,
+        "received": 0,
+        "head": "",
+        "metadata": metadata or {},
+    }
+    if file_type == "txt":
+        # TXT pages are laid out as the chunks arrive, so completing the
+        # upload needs no second pass over the file.
+        state["txt_index"] = start_txt_index()
+    open(data_path(upload_id), "wb").close()
+    _save_state(state)
+    return state
+
+
+def load_upload(upload_id):
+    if not _UPLOAD_ID_RE.match(upload_id or ""):
+        return None
+    try:
+        with open(_state_path(upload_id), "r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _get_hasher(state):
+    upload_id = state["upload_id"]
+    with _hashers_lock:
+        entry = _hashers.get(upload_id)
+    if entry and entry[0] == state["received"]:
+        return entry[1]
+
+    # The process restarted (or lost a chunk mid-write), so rebuild the
+    # digest from the bytes already acknowledged on disk.
+    hasher = hashlib.sha256()
+    remaining = state["received"]
+    with open(data_path(upload_id), "rb") as handle:
+        while remaining:
+            block = handle.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def append_chunk(state, offset, stream):
+    if offset != state["received"]:
+        raise ValueError(f"Expected offset {state['received']}.")
+
+    hasher = _get_hasher(state)
+    head = bytes.fromhex(state["head"])
+    try:
+        with open(data_path(state["upload_id"]), "r+b") as handle:
+            handle.seek(state["received"])
+            handle.truncate()
+            while True:
+                block = stream.read(STREAM_BLOCK_SIZE)
+                if not block:
+                    break
+                if state["received"] + len(block) > state["total_size"]:
+                    raise ValueError("Upload exceeds the declared size.")
+                if len(head) < MAGIC_HEAD_SIZE:
+                    head += block[: MAGIC_HEAD_SIZE - len(head)]
+                    validate_head(state["file_type"], head)
+                if state["file_type"] == "txt":
+                    validate_head("txt", block)
+                handle.write(block)
+                hasher.update(block)
+                state["received"] += len(block)
+                if "txt_index" in state:
+                    feed_txt_index(state["txt_index"], block)
+    finally:
+        state["head"] = head.hex()
+        with _hashers_lock:
+            _hashers[state["upload_id"]] = (state["received"], hasher)
+        _save_state(state)
+    return state
+
+
+def finish_upload(state, target_path, expected_sha256=None):
+    if state["received"] != state["total_size"]:
+        raise ValueError(
+            f"Upload incomplete: {state['received']} of {state['total_size']} bytes received."
+        )
+    validate_head(state["file_type"], bytes.fromhex(state["head"]), final=True)
+    digest = _get_hasher(state).hexdigest()
+    if expected_sha256 and expected_sha256.lower() != digest:
+        raise ValueError("Checksum mismatch.")
+
+    os.replace(data_path(state["upload_id"]), target_path)
+    discard_upload(state["upload_id"])
+    return digest
+
+
+def upload_index(state, file_path, words_per_page):
+    """The page index built while a finished upload arrived, or None.
+
+    None means the book must be indexed from the file: it is not TXT, or it
+    was paginated for a different page size or sentence language.
+    """
+    txt_index = state.get("txt_index")
+    if (
+        not txt_index
+        or txt_index["words_per_page"] != words_per_page
+        or txt_index["language"] != Config.SENTENCE_LANGUAGE.lower()
+    ):
+        return None
+    return finish_txt_index(txt_index, file_path)
+
+
+def discard_upload(upload_id):
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+    for path in (_state_path(upload_id), data_path(upload_id)):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def expire_uploads(max_age=None):
+    """Discard unfinished uploads untouched for ``max_age`` seconds; returns how many."""
+    max_age = Config.UPLOAD_EXPIRY_SECONDS if max_age is None else max_age
+    cutoff = time.time() - max_age
+    expired = 0
+    try:
+        names = os.listdir(_partial_dir())
+    except OSError:
+        names = []
+    live = set()
+    for name in names:
+        upload_id, ext = os.path.splitext(name)
+        if ext != ".json" or not _UPLOAD_ID_RE.match(upload_id):
+            continue
+        try:
+            stale = os.path.getmtime(os.path.join(_partial_dir(), name)) < cutoff
+        except OSError:
+            continue
+        if stale:
+            discard_upload(upload_id)
+            expired += 1
+        else:
+            live.add(upload_id)
+    # Another process may have finished or expired an upload this one was
+    # hashing; its digest state is not needed any more.
+    with _hashers_lock:
+        for upload_id in set(_hashers) - live:
+            del _hashers[upload_id]
+    return expired
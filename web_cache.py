@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+import os
+
+from flask import request
+
+from cache import TTLCache
+
+
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+COMPRESS_MIN_SIZE = 500
+COMPRESS_LEVEL = 6
+COMPRESS_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+}
+
+_static_hashes = {}
+_compressed_static = TTLCache(ttl=STATIC_MAX_AGE, max_entries=64)
+
+
+def static_fingerprint(static_folder, filename):
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    key = (path, mtime)
+    fingerprint = _static_hashes.get(key)
+    if fingerprint is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as handle:
+            for block in iter(lambda: handle.read(65536), b""):
+                digest.update(block)
+        fingerprint = digest.hexdigest()[:12]
+        _static_hashes[key] = fingerprint
+    return fingerprint
+
+
+def _accepts_gzip():
+    return "gzip" in request.headers.get("Accept-Encoding", "").lower()
+
+
+def _compress(response):
+    if response.status_code != 200 or "Content-Encoding" in response.headers:
+        return response
+    if response.mimetype not in COMPRESS_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    if not _accepts_gzip():
+        return response
+
+    if response.direct_passthrough:
+        # send_file responses stream from disk; the compressed copy is keyed by
+        # the ETag so each static file version is only compressed once.
+        cache_key = response.get_etag()[0]
+        response.direct_passthrough = False
+        data = response.get_data()
+        compressed = _compressed_static.get(cache_key) if cache_key else None
+        if compressed is None:
+            compressed = gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+            if cache_key:
+                _compressed_static.set(cache_key, compressed)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        compressed = gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+
+    if len(compressed) >= len(data):
+        return response
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def init_app(app):
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint != "static" or "v" in values:
+            return
+        fingerprint = static_fingerprint(app.static_folder, values.get("filename", ""))
+        if fingerprint:
+            values["v"] = fingerprint
+
+    @app.after_request
+    def apply_cache_headers(response):
+        if request.method != "GET":
+            return response
+
+        if request.endpoint == "static":
+            if request.args.get("v"):
+                response.cache_control.public = True
+                response.cache_control.max_age = STATIC_MAX_AGE
+                response.cache_control.immutable = True
+            else:
+                response.cache_control.no_cache = True
+        elif response.status_code == 200 and response.mimetype == "text/html":
+            response.cache_control.no_cache = True
+            response.cache_control.private = True
+            response.add_etag(weak=True)
+            response.make_conditional(request)
+
+        return _compress(response)